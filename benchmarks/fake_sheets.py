@@ -0,0 +1,167 @@
+"""In-memory stand-in for the parts of gspread that post_to_threads.py uses.
+
+FakeSpreadsheet/FakeWorksheet keep cell values in lists of rows, count every
+API-shaped call by method name and can add a fixed latency per call so Sheets
+round trips show up in the benchmark timings. install_fake_sheet() plugs a
+FakeSpreadsheet into post_to_threads' shared client cache.
+"""
+import threading
+import time
+from collections import Counter
+
+import gspread
+from gspread.utils import a1_to_rowcol
+
+READY_TO_POST_HEADERS = [
+    'Post_ID', 'Account_Name', 'Status', 'Block_1_Content', 'Block_2_Content',
+    'Block_3_Content', 'Block_4_Content', 'Threads_Post_ID', 'Notes',
+]
+POSTED_LOGS_HEADERS = [
+    'Original_Post_ID', 'Threads_Post_ID', 'Account', 'Timestamp_Posted',
+    'Insights_Last_Checked', 'Views', 'Likes', 'Replies',
+]
+
+
+class FakeCredentials:
+    valid = True
+
+    def refresh(self, request):
+        pass
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, rows):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.rows = [list(row) for row in rows]
+
+    def _call(self, method):
+        self.spreadsheet.record_call(f"{self.title}.{method}")
+
+    def _set(self, row_number, col, value):
+        while len(self.rows) < row_number:
+            self.rows.append([])
+        row = self.rows[row_number - 1]
+        if len(row) < col:
+            row.extend([''] * (col - len(row)))
+        row[col - 1] = value
+
+    def get_all_values(self, **kwargs):
+        self._call('get_all_values')
+        with self.spreadsheet.lock:
+            width = max((len(row) for row in self.rows), default=0)
+            return [list(row) + [''] * (width - len(row)) for row in self.rows]
+
+    def row_values(self, row, **kwargs):
+        self._call('row_values')
+        with self.spreadsheet.lock:
+            values = list(self.rows[row - 1]) if row <= len(self.rows) else []
+        while values and values[-1] == '': # Sheets drops trailing empty cells
+            values.pop()
+        return values
+
+    def batch_get(self, ranges, **kwargs):
+        self._call('batch_get')
+        results = []
+        with self.spreadsheet.lock:
+            for a1_range in ranges:
+                start, _, end = a1_range.partition(':')
+                start_row, start_col = a1_to_rowcol(start)
+                end_row, end_col = a1_to_rowcol(end) if end else (start_row, start_col)
+                values = []
+                for row_number in range(start_row, min(end_row, len(self.rows)) + 1):
+                    row = self.rows[row_number - 1][start_col - 1:end_col]
+                    while row and row[-1] == '': # Sheets drops trailing empty cells
+                        row = row[:-1]
+                    values.append(list(row))
+                while values and not values[-1]:
+                    values.pop()
+                results.append(values)
+        return results
+
+    def update_cells(self, cell_list, **kwargs):
+        self._call('update_cells')
+        with self.spreadsheet.lock:
+            for cell in cell_list:
+                self._set(cell.row, cell.col, cell.value)
+
+    def batch_update(self, data, **kwargs):
+        self._call('batch_update')
+        with self.spreadsheet.lock:
+            for entry in data:
+                start_row, start_col = a1_to_rowcol(entry['range'].split(':')[0])
+                for row_offset, values in enumerate(entry['values']):
+                    for col_offset, value in enumerate(values):
+                        self._set(start_row + row_offset, start_col + col_offset, value)
+
+    def append_row(self, values, **kwargs):
+        self._call('append_row')
+        with self.spreadsheet.lock:
+            self.rows.append(list(values))
+
+    def append_rows(self, values, **kwargs):
+        self._call('append_rows')
+        with self.spreadsheet.lock:
+            self.rows.extend(list(row) for row in values)
+
+
+class FakeSpreadsheet:
+    def __init__(self, latency_ms=0.0):
+        self.latency_ms = latency_ms
+        self.lock = threading.RLock()
+        self.calls = Counter() # '<worksheet>.<method>' -> calls
+        self._calls_lock = threading.Lock()
+        self._worksheets = {}
+
+    def add_worksheet(self, title, rows):
+        self._worksheets[title] = FakeWorksheet(self, title, rows)
+        return self._worksheets[title]
+
+    def worksheet(self, title):
+        self.record_call('worksheet')
+        if title not in self._worksheets:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self._worksheets[title]
+
+    def record_call(self, name):
+        with self._calls_lock:
+            self.calls[name] += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+
+    def reset_counters(self):
+        with self._calls_lock:
+            self.calls.clear()
+
+    def total_calls(self):
+        with self._calls_lock:
+            return sum(self.calls.values())
+
+    def snapshot(self):
+        with self._calls_lock:
+            return dict(self.calls)
+
+
+def ready_to_post_rows(post_ids, account_for, blocks_per_post=2):
+    """Header plus one Ready row per Post_ID, with `blocks_per_post` non-empty blocks each."""
+    rows = [list(READY_TO_POST_HEADERS)]
+    for post_id in post_ids:
+        blocks = [f"{post_id} block {n} " + 'lorem ipsum ' * 10 if n <= blocks_per_post else '' for n in range(1, 5)]
+        rows.append([post_id, account_for(post_id), 'Ready'] + blocks + ['', ''])
+    return rows
+
+
+def build_fake_spreadsheet(ready_rows, latency_ms=0.0, ready_title='Ready_To_Post', posted_title='Posted_Logs'):
+    spreadsheet = FakeSpreadsheet(latency_ms=latency_ms)
+    spreadsheet.add_worksheet(ready_title, ready_rows)
+    spreadsheet.add_worksheet(posted_title, [list(POSTED_LOGS_HEADERS)])
+    return spreadsheet
+
+
+def install_fake_sheet(bot, spreadsheet):
+    """Makes `bot.get_google_sheet_client()` return `spreadsheet` and drops every cached Sheets state."""
+    with bot._sheets_lock:
+        bot._sheets_cache['credentials'] = FakeCredentials()
+        bot._sheets_cache['sheet'] = spreadsheet
+        bot._sheets_cache['worksheets'] = {}
+    bot.invalidate_ready_to_post_snapshot()
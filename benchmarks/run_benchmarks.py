@@ -0,0 +1,309 @@
+"""Offline benchmarks for post_to_threads.py.
+
+Runs the real Flask routes against a local stub Threads API
+(stub_threads_api.py) and an in-memory fake of the gspread worksheet API
+(fake_sheets.py). No Google or Meta account or network access is needed.
+Each scenario reports throughput (posts/min, or insights/min), p50/p99
+latency per request, and Threads/Sheets API calls per post.
+
+    python benchmarks/run_benchmarks.py                    # every scenario
+    python benchmarks/run_benchmarks.py single_post --posts 50
+    python benchmarks/run_benchmarks.py --save baseline.json
+    python benchmarks/run_benchmarks.py --compare baseline.json   # exits 1 on regression
+
+The bot's settings are read from the environment as usual. This script only
+fills in defaults that keep it offline and fast: the stub base URL, a temporary
+JOBS_DB_PATH and SHEETS_JOURNAL_PATH, bench account credentials, quotas high
+enough not to throttle (unless --real-quotas is given), short retry delays, and
+LOG_LEVEL=CRITICAL. Export any of these variables to override them.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_sheets import build_fake_spreadsheet, install_fake_sheet, ready_to_post_rows  # noqa: E402
+from stub_threads_api import StubConfig, StubThreadsAPI  # noqa: E402
+
+SCENARIOS = ('single_post', 'concurrent_accounts', 'bulk_insights', 'failure_storm')
+
+
+def bench_account(index):
+    return f"BENCH{index + 1}"
+
+
+def configure_environment(args, stub, workdir):
+    """Sets env defaults for an offline run. Must happen before post_to_threads is imported."""
+    defaults = {
+        'THREADS_API_BASE_URL': stub.base_url,
+        'JOBS_DB_PATH': os.path.join(workdir, 'jobs.db'),
+        'SHEETS_JOURNAL_PATH': os.path.join(workdir, 'sheets_journal.jsonl'),
+        'LOG_LEVEL': 'CRITICAL', # The failure storm would otherwise flood stderr
+        'CONTAINER_POLL_INITIAL_SECONDS': '0.25',
+        'RETRY_BASE_DELAY_SECONDS': '0.1',
+        'RETRY_MAX_DELAY_SECONDS': '1',
+        'JOB_WORKER_COUNT': str(max(4, args.accounts)),
+        'INSIGHTS_BATCH_MAX_WORKERS': str(args.insights_workers),
+        'THREADS_DAILY_POST_LIMIT': '1000000',
+    }
+    if not args.real_quotas:
+        defaults.update({
+            'THREADS_API_CALLS_PER_MINUTE': '1000000',
+            'SHEETS_READS_PER_MINUTE': '1000000',
+            'SHEETS_WRITES_PER_MINUTE': '1000000',
+        })
+    for index in range(max(args.accounts, 1)):
+        defaults[f"THREADS_USER_ID_{bench_account(index)}"] = str(1000 + index)
+        defaults[f"THREADS_ACCESS_TOKEN_{bench_account(index)}"] = f"bench-token-{index + 1}"
+    for name, value in defaults.items():
+        os.environ.setdefault(name, value)
+
+
+# --- Measurement ---
+def percentile(values, pct):
+    """Nearest-rank percentile of `values` (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(name, units, latencies, succeeded, elapsed, stub, spreadsheet, extra=None):
+    total = len(latencies)
+    per_unit = max(total, 1)
+    stub_stats = stub.snapshot()
+    result = {
+        'scenario': name,
+        'units': units,
+        'count': total,
+        'succeeded': succeeded,
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_per_min': round(total / elapsed * 60, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'threads_calls_per_unit': round(sum(stub_stats['calls'].values()) / per_unit, 2),
+        'sheets_calls_per_unit': round(spreadsheet.total_calls() / per_unit, 2),
+        'threads_calls': stub_stats['calls'],
+        'threads_errors_injected': stub_stats['errors'],
+        'sheets_calls': spreadsheet.snapshot(),
+    }
+    if extra:
+        result.update(extra)
+    return result
+
+
+def run_concurrently(worker_count, work):
+    """Runs work(worker_index) on `worker_count` threads and waits for all of them."""
+    threads = [threading.Thread(target=work, args=(index,), name=f"bench-{index}") for index in range(worker_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def fresh_sheet(bot, args, post_ids, account_for):
+    """Flushes anything still buffered from the previous scenario, then installs a new fake spreadsheet."""
+    bot.flush_sheets_writes()
+    spreadsheet = build_fake_spreadsheet(
+        ready_to_post_rows(post_ids, account_for, blocks_per_post=args.blocks),
+        latency_ms=args.sheets_latency_ms,
+        ready_title=bot.READY_TO_POST_WORKSHEET_NAME,
+        posted_title=bot.POSTED_LOGS_WORKSHEET_NAME,
+    )
+    install_fake_sheet(bot, spreadsheet)
+    return spreadsheet
+
+
+def post_via_route(client, post_id, account_name):
+    """Posts one row through /process_post in synchronous mode. Returns (seconds, succeeded)."""
+    started = time.perf_counter()
+    response = client.post('/process_post', json={'post_id': post_id, 'account_name': account_name, 'wait': True})
+    seconds = time.perf_counter() - started
+    body = response.get_json(silent=True) or {}
+    return seconds, response.status_code == 200 and body.get('status') == 'success'
+
+
+def run_posting(bot, stub, args, name, account_count, posts_per_account):
+    post_ids = [f"{name}-{index:05d}" for index in range(account_count * posts_per_account)]
+    account_for = lambda post_id: bench_account(int(post_id.rsplit('-', 1)[1]) % account_count)  # noqa: E731
+    spreadsheet = fresh_sheet(bot, args, post_ids, account_for)
+    stub.reset_counters()
+    spreadsheet.reset_counters()
+
+    latencies = []
+    succeeded = [0]
+    results_lock = threading.Lock()
+
+    def account_worker(account_index):
+        client = bot.app.test_client()
+        for post_id in post_ids[account_index::account_count]:
+            seconds, ok = post_via_route(client, post_id, bench_account(account_index))
+            with results_lock:
+                latencies.append(seconds)
+                succeeded[0] += ok
+
+    started = time.perf_counter()
+    run_concurrently(account_count, account_worker)
+    bot.flush_sheets_writes() # Count the buffered Sheets writes these posts caused
+    elapsed = time.perf_counter() - started
+    return summarize(name, 'posts', latencies, succeeded[0], elapsed, stub, spreadsheet)
+
+
+# --- Scenarios ---
+def scenario_single_post(bot, stub, args):
+    """One account posting rows back to back through /process_post."""
+    return run_posting(bot, stub, args, 'single_post', 1, args.posts)
+
+
+def scenario_concurrent_accounts(bot, stub, args):
+    """`--accounts` accounts posting at the same time, `--posts` rows each."""
+    return run_posting(bot, stub, args, 'concurrent_accounts', args.accounts, args.posts)
+
+
+def scenario_failure_storm(bot, stub, args):
+    """Concurrent accounts while the stub fails `--storm-error-rate` of calls with 429/5xx/400."""
+    previous_rate = stub.config.error_rate
+    stub.config.error_rate = args.storm_error_rate
+    try:
+        result = run_posting(bot, stub, args, 'failure_storm', args.accounts, args.posts)
+    finally:
+        stub.config.error_rate = previous_rate
+    result['error_rate'] = args.storm_error_rate
+    return result
+
+
+def scenario_bulk_insights(bot, stub, args):
+    """Insights for `--insights` posts through /get_thread_insights_batch, bypassing the cache."""
+    spreadsheet = fresh_sheet(bot, args, [], lambda post_id: bench_account(0))
+    stub.reset_counters()
+    spreadsheet.reset_counters()
+    timestamp_posted = datetime.now().isoformat()
+    items = [
+        {'threads_post_id': f"m-insights-{index}", 'account_name': bench_account(index % max(args.accounts, 1)), 'timestamp_posted': timestamp_posted}
+        for index in range(args.insights)
+    ]
+    client = bot.app.test_client()
+    latencies = []
+    succeeded = 0
+    started = time.perf_counter()
+    for offset in range(0, len(items), args.insights_batch_size):
+        batch = items[offset:offset + args.insights_batch_size]
+        batch_started = time.perf_counter()
+        response = client.post('/get_thread_insights_batch', json={'items': batch, 'bypass_cache': True})
+        batch_seconds = time.perf_counter() - batch_started
+        body = response.get_json(silent=True) or {}
+        succeeded += body.get('succeeded', 0)
+        latencies.extend([batch_seconds] * len(batch)) # Every item in a batch waits for the whole batch
+    elapsed = time.perf_counter() - started
+    return summarize('bulk_insights', 'insights', latencies, succeeded, elapsed, stub, spreadsheet,
+                     extra={'batch_size': args.insights_batch_size})
+
+
+SCENARIO_FUNCTIONS = {
+    'single_post': scenario_single_post,
+    'concurrent_accounts': scenario_concurrent_accounts,
+    'bulk_insights': scenario_bulk_insights,
+    'failure_storm': scenario_failure_storm,
+}
+
+
+# --- Reporting ---
+def print_report(results):
+    header = f"{'scenario':<22}{'count':>7}{'ok':>7}{'per min':>10}{'p50 ms':>10}{'p99 ms':>10}{'threads/unit':>14}{'sheets/unit':>13}"
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        print(f"{result['scenario']:<22}{result['count']:>7}{result['succeeded']:>7}{result['throughput_per_min']:>10}"
+              f"{result['p50_ms']:>10}{result['p99_ms']:>10}{result['threads_calls_per_unit']:>14}{result['sheets_calls_per_unit']:>13}")
+
+
+def compare_to_baseline(results, baseline_path, tolerance):
+    """Returns a list of human-readable regressions against a --save'd baseline."""
+    with open(baseline_path, encoding='utf-8') as baseline_file:
+        baseline = {entry['scenario']: entry for entry in json.load(baseline_file)['results']}
+    regressions = []
+    for result in results:
+        base = baseline.get(result['scenario'])
+        if base is None:
+            continue
+        name = result['scenario']
+        if result['throughput_per_min'] < base['throughput_per_min'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {result['throughput_per_min']}/min vs baseline {base['throughput_per_min']}/min")
+        if result['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {result['p99_ms']} ms vs baseline {base['p99_ms']} ms")
+        for key in ('threads_calls_per_unit', 'sheets_calls_per_unit'):
+            if result[key] > base[key] * (1 + tolerance) + 0.01:
+                regressions.append(f"{name}: {key} {result[key]} vs baseline {base[key]}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Offline throughput/latency benchmarks for post_to_threads.py.')
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help=f"Scenarios to run (default: all of {', '.join(SCENARIOS)}).")
+    parser.add_argument('--posts', type=int, default=10, help='Posts per account (default 10).')
+    parser.add_argument('--accounts', type=int, default=4, help='Accounts for the concurrent and failure-storm scenarios (default 4).')
+    parser.add_argument('--blocks', type=int, default=2, choices=range(1, 5), help='Non-empty blocks per post (default 2).')
+    parser.add_argument('--insights', type=int, default=500, help='Posts to fetch insights for (default 500).')
+    parser.add_argument('--insights-batch-size', type=int, default=100)
+    parser.add_argument('--insights-workers', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Mean stub Threads API latency (default 50).')
+    parser.add_argument('--jitter-ms', type=float, default=10.0)
+    parser.add_argument('--container-ready-seconds', type=float, default=0.2, help='How long stub containers stay IN_PROGRESS.')
+    parser.add_argument('--sheets-latency-ms', type=float, default=100.0, help='Latency added to every fake Sheets call (default 100).')
+    parser.add_argument('--storm-error-rate', type=float, default=0.3, help='Share of stub calls that fail in failure_storm (default 0.3).')
+    parser.add_argument('--real-quotas', action='store_true', help="Keep the bot's default rate limits instead of lifting them.")
+    parser.add_argument('--save', metavar='PATH', help='Write results as JSON to PATH.')
+    parser.add_argument('--compare', metavar='PATH', help='Compare against a --save baseline and exit 1 on regression.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative slowdown before --compare fails (default 0.2).')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+    args.scenarios = args.scenarios or list(SCENARIOS)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stub = StubThreadsAPI(StubConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        container_ready_seconds=args.container_ready_seconds,
+    )).start()
+    workdir = tempfile.mkdtemp(prefix='threads-bench-')
+    configure_environment(args, stub, workdir)
+
+    import post_to_threads as bot # Reads its configuration from the environment at import time
+
+    results = []
+    try:
+        for name in args.scenarios:
+            print(f"Running {name}...", file=sys.stderr)
+            results.append(SCENARIO_FUNCTIONS[name](bot, stub, args))
+    finally:
+        stub.stop()
+
+    print_report(results)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as save_file:
+            json.dump({'args': vars(args), 'results': results}, save_file, indent=2, default=str)
+        print(f"Saved results to {args.save}", file=sys.stderr)
+    if args.compare:
+        regressions = compare_to_baseline(results, args.compare, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.compare} (tolerance {args.tolerance:.0%}).")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""Local stand-in for the Threads Graph API, used by the offline benchmarks.
+
+Serves the endpoints post_to_threads.py calls (container create, container
+status, publish, insights, post timestamp) with configurable latency and error
+injection, and counts every call by endpoint. Point THREADS_API_BASE_URL at
+`StubThreadsAPI.base_url` before importing post_to_threads.
+"""
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+API_PREFIX = '/v1.0/'
+
+
+class StubConfig:
+    """Behaviour knobs, safe to change while the server is running."""
+
+    def __init__(self, latency_ms=50.0, jitter_ms=10.0, error_rate=0.0, container_ready_seconds=0.2,
+                 error_mix=(('429', 0.4), ('500', 0.4), ('400', 0.2)), retry_after_seconds=0.2):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate # Share of calls answered with an injected error
+        self.container_ready_seconds = container_ready_seconds # IN_PROGRESS until a container is this old
+        self.error_mix = error_mix # (kind, weight) pairs: '429' rate limit, '500' server error, '400' validation error
+        self.retry_after_seconds = retry_after_seconds # Sent with injected 429s
+
+
+class StubThreadsAPI:
+    def __init__(self, config=None, host='127.0.0.1', port=0):
+        self.config = config or StubConfig()
+        self.calls = Counter() # endpoint label -> calls
+        self.errors = Counter() # injected error kind -> count
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._containers = {} # creation_id -> (created_monotonic, published_media_id or None)
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='stub-threads-api', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls.clear()
+            self.errors.clear()
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+    def snapshot(self):
+        with self._lock:
+            return {'calls': dict(self.calls), 'errors': dict(self.errors)}
+
+    # --- Request handling ---
+    def _count(self, endpoint):
+        with self._lock:
+            self.calls[endpoint] += 1
+
+    def _pick_error(self):
+        config = self.config
+        if config.error_rate <= 0 or random.random() >= config.error_rate:
+            return None
+        kinds, weights = zip(*config.error_mix)
+        kind = random.choices(kinds, weights=weights)[0]
+        with self._lock:
+            self.errors[kind] += 1
+        return kind
+
+    def _sleep_latency(self):
+        config = self.config
+        delay_ms = max(0.0, random.gauss(config.latency_ms, config.jitter_ms)) if config.jitter_ms else config.latency_ms
+        if delay_ms:
+            time.sleep(delay_ms / 1000.0)
+
+    def _error_response(self, kind):
+        if kind == '429':
+            body = {'error': {'message': 'Application request limit reached', 'type': 'OAuthException', 'code': 4}}
+            return 429, body, {'Retry-After': str(self.config.retry_after_seconds)}
+        if kind == '500':
+            return 500, {'error': {'message': 'An unexpected error has occurred.', 'code': 2, 'is_transient': True}}, {}
+        return 400, {'error': {'message': 'Invalid parameter', 'type': 'OAuthException', 'code': 100}}, {}
+
+    def handle(self, method, path, params):
+        """Returns (status, body, headers) for one request."""
+        if not path.startswith(API_PREFIX):
+            return 404, {'error': {'message': f'Unknown path {path}'}}, {}
+        parts = [part for part in path[len(API_PREFIX):].split('/') if part]
+        if method == 'POST' and len(parts) == 2 and parts[1] == 'threads':
+            endpoint = 'threads'
+        elif method == 'POST' and len(parts) == 2 and parts[1] == 'threads_publish':
+            endpoint = 'threads_publish'
+        elif method == 'GET' and len(parts) == 2 and parts[1] == 'insights':
+            endpoint = 'insights'
+        elif method == 'GET' and len(parts) == 1:
+            endpoint = 'media'
+        else:
+            return 404, {'error': {'message': f'Unknown endpoint {method} {path}'}}, {}
+
+        self._count(endpoint)
+        self._sleep_latency()
+        if not params.get('access_token'):
+            return 400, {'error': {'message': 'An access token is required', 'code': 190}}, {}
+        error_kind = self._pick_error()
+        if error_kind:
+            return self._error_response(error_kind)
+
+        if endpoint == 'threads':
+            creation_id = f"c{next(self._ids)}"
+            with self._lock:
+                self._containers[creation_id] = (time.monotonic(), None)
+            return 200, {'id': creation_id}, {}
+        if endpoint == 'threads_publish':
+            creation_id = params.get('creation_id')
+            with self._lock:
+                container = self._containers.get(creation_id)
+                if container is None:
+                    return 400, {'error': {'message': f'Unknown creation_id {creation_id}', 'code': 100}}, {}
+                media_id = container[1] or f"m{next(self._ids)}"
+                self._containers[creation_id] = (container[0], media_id)
+            return 200, {'id': media_id}, {}
+        if endpoint == 'insights':
+            metrics = params.get('metric', '').split(',')
+            return 200, {'data': [{'name': name, 'period': 'lifetime', 'values': [{'value': random.randint(0, 500)}]} for name in metrics if name]}, {}
+
+        object_id = parts[0]
+        fields = params.get('fields', '')
+        if 'timestamp' in fields:
+            return 200, {'id': object_id, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S+0000', time.gmtime())}, {}
+        with self._lock:
+            container = self._containers.get(object_id)
+        if container is None:
+            return 200, {'id': object_id, 'status': 'EXPIRED', 'error_message': 'Unknown container'}, {}
+        created, media_id = container
+        if media_id:
+            status = 'PUBLISHED'
+        elif time.monotonic() - created >= self.config.container_ready_seconds:
+            status = 'FINISHED'
+        else:
+            status = 'IN_PROGRESS'
+        return 200, {'id': object_id, 'status': status}, {}
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # Keep-alive, like graph.threads.net
+
+            def _respond(self, method):
+                parts = urlsplit(self.path)
+                params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+                status, body, headers = stub.handle(method, parts.path, params)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._respond('GET')
+
+            def do_POST(self):
+                self._respond('POST')
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run the stub Threads Graph API on its own.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    stub = StubThreadsAPI(StubConfig(latency_ms=args.latency_ms, error_rate=args.error_rate), port=args.port).start()
+    print(f"Stub Threads API listening at {stub.base_url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
@@ -1,13 +1,29 @@
+import asyncio
+import atexit
+import heapq
 import os
+import random
 import json
+import logging
 import time
 import requests
+from requests.adapters import HTTPAdapter
+import aiohttp
 import gspread
 from google.oauth2.service_account import Credentials
-import sys
-import traceback # Keep this uncommented for debugging if needed
-from flask import Flask, request, jsonify
-from datetime import datetime # --- NEW --- Import datetime
+from google.auth.transport.requests import Request as GoogleAuthRequest
+from google.auth.exceptions import GoogleAuthError
+import sqlite3
+import socket
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial, wraps
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from flask import Flask, g, request, jsonify, Response
+from datetime import datetime, timedelta # --- NEW --- Import datetime
 
 # --- Configuration ---
 GOOGLE_CREDENTIALS_JSON_CONTENT = os.environ.get('GOOGLE_CREDENTIALS_JSON_CONTENT')
@@ -15,192 +31,1154 @@ GOOGLE_SHEET_URL = os.environ.get('GOOGLE_SHEET_URL')
 READY_TO_POST_WORKSHEET_NAME = os.environ.get('READY_TO_POST_WORKSHEET_NAME', 'Ready_To_Post')
 POSTED_LOGS_WORKSHEET_NAME = 'Posted_Logs' # --- NEW --- Worksheet name for posted logs
 THREADS_API_BASE_URL = os.environ.get('THREADS_API_BASE_URL', 'https://graph.threads.net/v1.0/') # Used by your posting logic
-POST_DELAY_SECONDS = int(os.environ.get('POST_DELAY_SECONDS', 30))
+POST_DELAY_SECONDS = int(os.environ.get('POST_DELAY_SECONDS', 30)) # Upper bound on waiting for a container before publishing
+CONTAINER_READINESS_MODE = os.environ.get('CONTAINER_READINESS_MODE', 'poll').lower() # 'poll' = publish once FINISHED, 'sleep' = always wait POST_DELAY_SECONDS
+CONTAINER_POLL_INITIAL_SECONDS = float(os.environ.get('CONTAINER_POLL_INITIAL_SECONDS', 1))
+CONTAINER_POLL_MAX_SECONDS = float(os.environ.get('CONTAINER_POLL_MAX_SECONDS', 8))
+READY_TO_POST_CACHE_TTL_SECONDS = int(os.environ.get('READY_TO_POST_CACHE_TTL_SECONDS', 60))
+JOBS_DB_PATH = os.environ.get('JOBS_DB_PATH', 'jobs.db')
+JOB_WORKER_COUNT = int(os.environ.get('JOB_WORKER_COUNT', 4))
+JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', 900)) # A 'running' job untouched this long is assumed orphaned and re-queued
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_POLL_SECONDS = 2
+POSTING_ENGINE = os.environ.get('POSTING_ENGINE', 'threads').lower() # 'threads' = one worker thread per post, 'asyncio' = one event loop drives every post
+ASYNC_MAX_IN_FLIGHT_POSTS = int(os.environ.get('ASYNC_MAX_IN_FLIGHT_POSTS', 500))
+ASYNC_HTTP_CONNECTION_LIMIT = int(os.environ.get('ASYNC_HTTP_CONNECTION_LIMIT', 100)) # Open connections shared by all in-flight async posts
+ASYNC_BLOCKING_THREADS = int(os.environ.get('ASYNC_BLOCKING_THREADS', 64)) # Executor threads for the engine's SQLite, ledger and batch work
+ASYNC_SHEETS_THREADS = int(os.environ.get('ASYNC_SHEETS_THREADS', 16)) # Separate executor threads for Sheets steps, which can sleep on quota and claim settling
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'false').lower() == 'true' # Post Ready rows at their Scheduled_Time without n8n
+# Accepted values: ISO 8601 ("2026-10-17T10:00:00+02:00"), a Sheets date-time as displayed with one of
+# SCHEDULED_TIME_FORMATS (strptime patterns, ';'-separated), or a Sheets serial date number. Values without a UTC
+# offset are read in the server's local timezone (TZ), so set TZ to the spreadsheet's timezone.
+SCHEDULED_TIME_COLUMN = os.environ.get('SCHEDULED_TIME_COLUMN', 'Scheduled_Time')
+SCHEDULED_TIME_FORMATS = [f for f in os.environ.get('SCHEDULED_TIME_FORMATS', '%m/%d/%Y %H:%M:%S;%m/%d/%Y %H:%M;%m/%d/%Y;%Y-%m-%d %H:%M').split(';') if f]
+SCHEDULER_SYNC_SECONDS = float(os.environ.get('SCHEDULER_SYNC_SECONDS', 60)) # How often Ready_To_Post is re-read for edits
+SCHEDULER_MAX_LATENESS_SECONDS = float(os.environ.get('SCHEDULER_MAX_LATENESS_SECONDS', 86400)) # Rows overdue by more than this are left alone
+SCHEDULER_DEFAULT_ACCOUNT = os.environ.get('SCHEDULER_DEFAULT_ACCOUNT') # For rows without an Account_Name/Account column
+INSIGHTS_HARVEST_ENABLED = os.environ.get('INSIGHTS_HARVEST_ENABLED', 'false').lower() == 'true' # Keep Posted_Logs metrics filled in the background
+INSIGHTS_HARVEST_INTERVAL_SECONDS = float(os.environ.get('INSIGHTS_HARVEST_INTERVAL_SECONDS', 900))
+INSIGHTS_HARVEST_BATCH_SIZE = int(os.environ.get('INSIGHTS_HARVEST_BATCH_SIZE', 200)) # Rows fetched and written per cycle
+INSIGHTS_HARVEST_MAX_POST_AGE_DAYS = float(os.environ.get('INSIGHTS_HARVEST_MAX_POST_AGE_DAYS', 30)) # Older posts stop being refreshed once checked
+POST_LOCK_TTL_SECONDS = int(os.environ.get('POST_LOCK_TTL_SECONDS', 900)) # An in-flight lock older than this is from a dead worker
+ROW_CLAIM_MODE = os.environ.get('ROW_CLAIM_MODE', 'local').lower() # 'local' = SQLite lock only (replicas share JOBS_DB_PATH), 'sheet' = lease columns in Ready_To_Post
+WORKER_ID = os.environ.get('WORKER_ID') or f"{socket.gethostname()}:{os.getpid()}" # Written into claimed rows in 'sheet' mode
+CLAIM_OWNER_COLUMN = os.environ.get('CLAIM_OWNER_COLUMN', 'Claimed_By')
+CLAIM_EXPIRES_COLUMN = os.environ.get('CLAIM_EXPIRES_COLUMN', 'Claim_Expires') # Lease length is POST_LOCK_TTL_SECONDS
+CLAIM_SETTLE_SECONDS = float(os.environ.get('CLAIM_SETTLE_SECONDS', 5)) # Wait between writing a claim and checking we still hold it; must exceed a replica's read-to-write time
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', max(10, JOB_WORKER_COUNT * 2))) # Keep-alive connections kept per host
+HTTP_POOL_BLOCK = os.environ.get('HTTP_POOL_BLOCK', 'false').lower() == 'true' # Wait for a free connection instead of opening a throwaway one
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.environ.get('HTTP_CONNECT_TIMEOUT_SECONDS', 5))
+HTTP_READ_TIMEOUT_SECONDS = float(os.environ.get('HTTP_READ_TIMEOUT_SECONDS', 60))
+INSIGHTS_READ_TIMEOUT_SECONDS = float(os.environ.get('INSIGHTS_READ_TIMEOUT_SECONDS', 30))
+INSIGHTS_METRICS = "likes,replies,reposts,quotes,shares,views"
+INSIGHTS_BATCH_MAX_WORKERS = int(os.environ.get('INSIGHTS_BATCH_MAX_WORKERS', 8))
+INSIGHTS_BATCH_MAX_ITEMS = int(os.environ.get('INSIGHTS_BATCH_MAX_ITEMS', 500))
+INSIGHTS_CACHE_MAX_ENTRIES = int(os.environ.get('INSIGHTS_CACHE_MAX_ENTRIES', 5000))
+# "max_post_age_seconds:ttl_seconds" pairs, youngest first. Default: <1h -> 1 min, <1d -> 5 min, <7d -> 1 h, older -> 6 h.
+INSIGHTS_CACHE_TTL_TIERS = os.environ.get('INSIGHTS_CACHE_TTL_TIERS', '3600:60,86400:300,604800:3600,inf:21600')
+INSIGHTS_TIMESTAMP_RETRY_SECONDS = float(os.environ.get('INSIGHTS_TIMESTAMP_RETRY_SECONDS', 3600)) # After a failed post timestamp lookup, use the youngest tier this long before asking again
+THREADS_API_CALLS_PER_MINUTE = float(os.environ.get('THREADS_API_CALLS_PER_MINUTE', 120)) # Per account
+SHEETS_READS_PER_MINUTE = float(os.environ.get('SHEETS_READS_PER_MINUTE', 60)) # Google's default per-user quota
+SHEETS_WRITES_PER_MINUTE = float(os.environ.get('SHEETS_WRITES_PER_MINUTE', 60))
+RETRY_BASE_DELAY_SECONDS = float(os.environ.get('RETRY_BASE_DELAY_SECONDS', 2))
+RETRY_MAX_DELAY_SECONDS = float(os.environ.get('RETRY_MAX_DELAY_SECONDS', 60))
+THREADS_DAILY_POST_LIMIT = int(os.environ.get('THREADS_DAILY_POST_LIMIT', 250)) # Threads API: 250 published posts per profile per 24h
+THREADS_MIN_POST_INTERVAL_SECONDS = int(os.environ.get('THREADS_MIN_POST_INTERVAL_SECONDS', 0))
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower() # 'json' (one object per line) or 'text'
+LOG_PAYLOAD_SAMPLE_RATE = float(os.environ.get('LOG_PAYLOAD_SAMPLE_RATE', 1.0)) # Share of DEBUG payload dumps actually written
+SHEETS_WRITE_BEHIND = os.environ.get('SHEETS_WRITE_BEHIND', 'true').lower() == 'true'
+SHEETS_JOURNAL_PATH = os.environ.get('SHEETS_JOURNAL_PATH', 'sheets_journal.jsonl')
+SHEETS_FLUSH_INTERVAL_SECONDS = float(os.environ.get('SHEETS_FLUSH_INTERVAL_SECONDS', 2))
+SHEETS_FLUSH_MAX_PENDING = int(os.environ.get('SHEETS_FLUSH_MAX_PENDING', 50)) # Flush early once this many writes are buffered
+READY_TO_POST_MIN_RELOAD_SECONDS = 2 # Floor between miss-triggered reloads so unknown IDs can't hammer the read quota
 
 
+# --- Logging ---
+# Leveled logging to stderr, one JSON object per line by default. Full request
+# and response payloads are only logged at DEBUG through log_payload(), which
+# samples them and defers formatting until a line is actually written, so at
+# INFO they cost nothing on the hot path.
+class JsonLogFormatter(logging.Formatter):
+    _standard_attrs = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self._standard_attrs:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+logger = logging.getLogger('threads_bot')
+
+def _configure_logging():
+    handler = logging.StreamHandler()
+    if LOG_FORMAT == 'json':
+        handler.setFormatter(JsonLogFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(threadName)s] %(message)s'))
+    logger.handlers[:] = [handler]
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+_configure_logging()
+
+def log_payload(message, *args):
+    """Logs a verbose payload at DEBUG, sampled by LOG_PAYLOAD_SAMPLE_RATE. `args` are only formatted if emitted."""
+    if logger.isEnabledFor(logging.DEBUG) and (LOG_PAYLOAD_SAMPLE_RATE >= 1 or random.random() < LOG_PAYLOAD_SAMPLE_RATE):
+        logger.debug(message, *args)
+
+# --- Metrics ---
+# In-process counters and latency histograms, exposed in Prometheus text format
+# on /metrics. Stages of process_post, every outbound Threads/Sheets call and
+# every Flask request are timed and labelled by endpoint, account and outcome.
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+_metrics_lock = threading.Lock()
+_metric_families = {} # name -> (type, help)
+_counters = {} # (name, labels) -> value
+_histograms = {} # (name, labels) -> [bucket_counts, sum, count]
+_gauge_collectors = [] # callables returning [(name, help, labels_dict, value)]
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def inc_counter(name, help_text, amount=1, **labels):
+    with _metrics_lock:
+        _metric_families.setdefault(name, ('counter', help_text))
+        key = (name, _label_key(labels))
+        _counters[key] = _counters.get(key, 0) + amount
+
+def observe_histogram(name, help_text, value, **labels):
+    with _metrics_lock:
+        _metric_families.setdefault(name, ('histogram', help_text))
+        key = (name, _label_key(labels))
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [[0] * len(METRICS_LATENCY_BUCKETS), 0.0, 0]
+        for i, bound in enumerate(METRICS_LATENCY_BUCKETS):
+            if value <= bound:
+                hist[0][i] += 1
+        hist[1] += value
+        hist[2] += 1
+
+def register_gauge_collector(collector):
+    """Registers a callable evaluated on each scrape, returning [(name, help, labels, value)]."""
+    _gauge_collectors.append(collector)
+
+@contextmanager
+def timed_stage(stage, account='', **labels):
+    """Times a block as a process_post stage. Set result['outcome'] inside the block to override 'ok'."""
+    result = {'outcome': 'ok'}
+    start = time.perf_counter()
+    try:
+        yield result
+    except Exception:
+        result['outcome'] = 'exception'
+        raise
+    finally:
+        observe_histogram(
+            'threads_bot_stage_duration_seconds', 'Duration of posting pipeline stages.',
+            time.perf_counter() - start, stage=stage, account=str(account).upper(), outcome=result['outcome'], **labels
+        )
+
+def timed_function(stage):
+    """Decorator form of timed_stage(); a False return value counts as outcome 'error'."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed_stage(stage) as result:
+                value = func(*args, **kwargs)
+                if value is False:
+                    result['outcome'] = 'error'
+                return value
+        return wrapper
+    return decorator
+
+def record_outbound_call(api, endpoint, seconds, outcome, account=''):
+    observe_histogram(
+        'threads_bot_outbound_request_duration_seconds', 'Duration of outbound Threads and Google Sheets calls.',
+        seconds, api=api, endpoint=endpoint, account=str(account).upper(), outcome=outcome
+    )
+
+def _escape_label_value(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(label_items):
+    if not label_items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape_label_value(v)}"' for k, v in label_items) + '}'
+
+def render_prometheus_metrics():
+    """Returns every metric in Prometheus text exposition format."""
+    lines = []
+    with _metrics_lock:
+        families = dict(_metric_families)
+        counters = dict(_counters)
+        histograms = {k: (list(v[0]), v[1], v[2]) for k, v in _histograms.items()}
+    gauges = {}
+    for collector in _gauge_collectors:
+        try:
+            for name, help_text, labels, value in collector():
+                families.setdefault(name, ('gauge', help_text))
+                gauges[(name, _label_key(labels))] = value
+        except Exception as e:
+            logger.warning(f"Metrics gauge collector {getattr(collector, '__name__', collector)} failed: {e}")
+
+    for name, (metric_type, help_text) in sorted(families.items()):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        if metric_type == 'histogram':
+            for (series_name, labels), (bucket_counts, total, count) in sorted(histograms.items()):
+                if series_name != name:
+                    continue
+                for bound, bucket_count in zip(METRICS_LATENCY_BUCKETS, bucket_counts):
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', repr(float(bound))),))} {bucket_count}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        else:
+            series = counters if metric_type == 'counter' else gauges
+            for (series_name, labels), value in sorted(series.items()):
+                if series_name == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+    return '\n'.join(lines) + '\n'
+
 # --- Initialize Flask App ---
 app = Flask(__name__)
 
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request_metrics(response):
+    started = getattr(g, 'request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        observe_histogram(
+            'threads_bot_http_request_duration_seconds', 'Duration of requests served by this app.',
+            time.perf_counter() - started, route=route, method=request.method, status=str(response.status_code)
+        )
+    return response
+
+# --- Rate Governor ---
+# Token buckets per API ('sheets:read', 'sheets:write') and per Threads account
+# ('threads:<NAME>'). Callers block in acquire() until a token is free, so
+# under load we run steadily at the quota rather than bursting into 429s. A
+# Retry-After from the server pauses the whole bucket. Errors are classified as
+# retryable (429, 5xx, Graph rate-limit/transient codes, network errors) or
+# terminal (other 4xx), and retryable ones back off exponentially with jitter.
+class TokenBucket:
+    def __init__(self, name, rate_per_minute, capacity=None):
+        self.name = name
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_minute / 6.0) # ~10 s of burst
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_second)
+        self.updated = now
+
+    def _try_take(self, tokens):
+        """Takes `tokens` and returns None if they are available, else returns seconds to wait."""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now >= self.blocked_until and self.tokens >= tokens:
+                self.tokens -= tokens
+                return None
+            return max(self.blocked_until - now, (tokens - self.tokens) / self.rate_per_second if self.rate_per_second else 1.0)
+
+    def acquire(self, tokens=1):
+        """Blocks until `tokens` are available, then takes them. Returns seconds spent waiting."""
+        waited = 0.0
+        while True:
+            wait = self._try_take(tokens)
+            if wait is None:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self, tokens=1):
+        """acquire() for the asyncio engine: awaits instead of blocking the thread."""
+        waited = 0.0
+        while True:
+            wait = self._try_take(tokens)
+            if wait is None:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds):
+        """Stops handing out tokens for `seconds` (e.g. from a Retry-After header)."""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+    def status(self):
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                'available': round(self.tokens, 2),
+                'capacity': round(self.capacity, 2),
+                'rate_per_minute': round(self.rate_per_second * 60, 2),
+                'paused_for_seconds': round(max(self.blocked_until - now, 0), 1),
+            }
+
+_rate_buckets_lock = threading.Lock()
+_rate_buckets = {}
+
+def get_rate_bucket(name):
+    """Returns the process-wide bucket for 'sheets:read', 'sheets:write' or 'threads:<ACCOUNT>'."""
+    with _rate_buckets_lock:
+        bucket = _rate_buckets.get(name)
+        if bucket is None:
+            if name == 'sheets:read':
+                rate = SHEETS_READS_PER_MINUTE
+            elif name == 'sheets:write':
+                rate = SHEETS_WRITES_PER_MINUTE
+            else:
+                account = name.split(':', 1)[1]
+                rate = float(os.getenv(f'THREADS_API_CALLS_PER_MINUTE_{account}', THREADS_API_CALLS_PER_MINUTE))
+            bucket = TokenBucket(name, rate)
+            _rate_buckets[name] = bucket
+        return bucket
+
+_prepaid_sheets_tokens = threading.local()
+
+@contextmanager
+def prepaid_sheets_calls(**calls):
+    """Takes the Sheets quota for the next calls up front (e.g. read=1, write=1).
+
+    sheets_call()s made inside the block use those tokens instead of waiting
+    on the bucket, so a timed sequence of calls isn't stretched by quota waits.
+    """
+    for kind, count in calls.items():
+        get_rate_bucket(f'sheets:{kind}').acquire(count)
+    previous = getattr(_prepaid_sheets_tokens, 'counts', None)
+    _prepaid_sheets_tokens.counts = dict(calls)
+    try:
+        yield
+    finally:
+        _prepaid_sheets_tokens.counts = previous
+
+def _take_prepaid_sheets_token(kind):
+    counts = getattr(_prepaid_sheets_tokens, 'counts', None)
+    if counts and counts.get(kind, 0) > 0:
+        counts[kind] -= 1
+        return True
+    return False
+
+def get_rate_limit_status():
+    """Returns {bucket_name: status} for every bucket used so far in this process."""
+    with _rate_buckets_lock:
+        buckets = dict(_rate_buckets)
+    return {name: bucket.status() for name, bucket in sorted(buckets.items())}
+
+def backoff_delay(attempt, retry_after=None, base_delay=None):
+    """Seconds to wait before retry number `attempt` (0-based): Retry-After if given, else full jitter."""
+    if retry_after is not None:
+        return min(retry_after, RETRY_MAX_DELAY_SECONDS)
+    base = RETRY_BASE_DELAY_SECONDS if base_delay is None else base_delay
+    return random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, base * (2 ** attempt)))
+
+def parse_retry_after(response):
+    if response is None:
+        return None
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        return None
+
+THREADS_RATE_LIMIT_ERROR_CODES = {4, 17, 32, 613} # Graph API: app/user/page/custom rate limits
+THREADS_RETRYABLE_ERROR_CODES = {1, 2} | THREADS_RATE_LIMIT_ERROR_CODES # Plus unknown/temporary errors
+
+def is_retryable_http_error(status_code, error_body=None):
+    """Classifies an HTTP error response. 429/5xx and Graph rate-limit codes are retryable, other 4xx are not."""
+    if status_code == 429 or status_code >= 500:
+        return True
+    error = error_body.get('error') if isinstance(error_body, dict) else None
+    if isinstance(error, dict):
+        if error.get('is_transient') or error.get('code') in THREADS_RETRYABLE_ERROR_CODES:
+            return True
+    return False
+
+def sheets_call(kind, func, *args, retries=4, **kwargs):
+    """Runs a gspread call under the 'sheets:<kind>' bucket, retrying quota and server errors with backoff."""
+    bucket = get_rate_bucket(f'sheets:{kind}')
+    attempt = 0
+    while True:
+        if not _take_prepaid_sheets_token(kind):
+            bucket.acquire()
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+            record_outbound_call('sheets', func.__name__, time.perf_counter() - started, 'ok')
+            return result
+        except gspread.exceptions.APIError as e:
+            status_code = getattr(e.response, 'status_code', e.code)
+            record_outbound_call('sheets', func.__name__, time.perf_counter() - started, f'http_{status_code}')
+            if attempt + 1 >= retries or not is_retryable_http_error(status_code):
+                raise
+            retry_after = parse_retry_after(e.response)
+            if status_code == 429:
+                bucket.pause(retry_after if retry_after is not None else backoff_delay(attempt))
+            wait = backoff_delay(attempt, retry_after)
+            logger.warning(f"Sheets {kind} call failed with {status_code} (attempt {attempt + 1}/{retries}). Retrying in {wait:.1f}s.")
+            time.sleep(wait)
+            attempt += 1
+
 # --- Helper Functions ---
-def get_google_sheet_client():
+# --- Google Sheets Client Cache ---
+# One authorized client, spreadsheet handle and set of worksheet handles is shared
+# by every request in the process. It is built lazily on first use and rebuilt
+# after an auth error (see invalidate_google_sheet_client).
+_sheets_lock = threading.RLock()
+_sheets_cache = {
+    'credentials': None,
+    'sheet': None,
+    'worksheets': {},
+}
+
+def _build_google_sheet_client():
     """Authenticates with Google Sheets using service account JSON content from env var."""
+    scopes = [
+        'https://www.googleapis.com/auth/spreadsheets',
+        'https://www.googleapis.com/auth/drive'
+    ]
+    logger.info("Attempting to load credentials from GOOGLE_CREDENTIALS_JSON_CONTENT")
+    if not GOOGLE_CREDENTIALS_JSON_CONTENT:
+         logger.error("GOOGLE_CREDENTIALS_JSON_CONTENT environment variable is not set in Railway.")
+         return None, None
     try:
-        scopes = [
-            'https://www.googleapis.com/auth/spreadsheets',
-            'https://www.googleapis.com/auth/drive'
-        ]
-        print("LOG: Attempting to load credentials from GOOGLE_CREDENTIALS_JSON_CONTENT")
-        if not GOOGLE_CREDENTIALS_JSON_CONTENT:
-             print("ERROR: GOOGLE_CREDENTIALS_JSON_CONTENT environment variable is not set in Railway.", file=sys.stderr)
-             return None
+        service_account_info = json.loads(GOOGLE_CREDENTIALS_JSON_CONTENT)
+        logger.info("Successfully loaded service account info from environment variable.")
+    except json.JSONDecodeError as e:
+         logger.exception(f"Could not decode JSON from GOOGLE_CREDENTIALS_JSON_CONTENT: {e}")
+         return None, None
+    credentials = Credentials.from_service_account_info(service_account_info, scopes=scopes)
+    logger.info("Successfully created credentials object.")
+    client = gspread.authorize(credentials)
+    sheet = sheets_call('read', client.open_by_url, GOOGLE_SHEET_URL)
+    logger.info(f"Successfully authorized and opened Google Sheet: {GOOGLE_SHEET_URL}")
+    return credentials, sheet
+
+def invalidate_google_sheet_client():
+    """Drops the cached client so the next get_google_sheet_client() call re-authorizes."""
+    with _sheets_lock:
+        _sheets_cache['credentials'] = None
+        _sheets_cache['sheet'] = None
+        _sheets_cache['worksheets'] = {}
+    logger.info("Google Sheets client cache invalidated.")
+
+def get_google_sheet_client():
+    """Returns the shared Google Sheet handle, authorizing on first use and refreshing expired tokens."""
+    with _sheets_lock:
+        sheet = _sheets_cache['sheet']
+        credentials = _sheets_cache['credentials']
+        if sheet is not None and credentials is not None:
+            if not credentials.valid:
+                try:
+                    logger.info("Google Sheets access token expired. Refreshing...")
+                    credentials.refresh(GoogleAuthRequest())
+                except Exception as e:
+                    logger.error(f"Could not refresh Google Sheets token, re-authorizing: {e}")
+                    invalidate_google_sheet_client()
+                    return get_google_sheet_client()
+            return sheet
         try:
-            service_account_info = json.loads(GOOGLE_CREDENTIALS_JSON_CONTENT)
-            print("LOG: Successfully loaded service account info from environment variable.")
-        except json.JSONDecodeError as e:
-             print(f"ERROR: Could not decode JSON from GOOGLE_CREDENTIALS_JSON_CONTENT: {e}", file=sys.stderr)
-             traceback.print_exc(file=sys.stderr)
-             return None
-        credentials = Credentials.from_service_account_info(service_account_info, scopes=scopes)
-        print("LOG: Successfully created credentials object.")
-        client = gspread.authorize(credentials)
-        sheet = client.open_by_url(GOOGLE_SHEET_URL)
-        print(f"LOG: Successfully authorized and opened Google Sheet: {GOOGLE_SHEET_URL}")
+            credentials, sheet = _build_google_sheet_client()
+        except Exception as e:
+            logger.exception(f"Error connecting to Google Sheets: {e}")
+            return None
+        if sheet is not None:
+            _sheets_cache['credentials'] = credentials
+            _sheets_cache['sheet'] = sheet
+            _sheets_cache['worksheets'] = {}
         return sheet
-    except Exception as e:
-        print(f"ERROR: Error connecting to Google Sheets: {e}", file=sys.stderr)
-        traceback.print_exc(file=sys.stderr)
+
+def get_worksheet(sheet, worksheet_name):
+    """Returns a worksheet handle, reusing the cached one when `sheet` is the shared client."""
+    with _sheets_lock:
+        if sheet is not _sheets_cache['sheet']:
+            return sheets_call('read', sheet.worksheet, worksheet_name)
+        worksheet = _sheets_cache['worksheets'].get(worksheet_name)
+        if worksheet is None:
+            worksheet = sheets_call('read', sheet.worksheet, worksheet_name)
+            _sheets_cache['worksheets'][worksheet_name] = worksheet
+        return worksheet
+
+def handle_sheets_error(e):
+    """Invalidates the shared client when a Sheets exception looks like an auth failure."""
+    is_auth_error = isinstance(e, GoogleAuthError)
+    if isinstance(e, gspread.exceptions.APIError) and e.code in (401, 403):
+        is_auth_error = True
+    if is_auth_error:
+        logger.warning(f"Google Sheets auth error, client will be rebuilt on next use: {e}")
+        invalidate_google_sheet_client()
+
+# --- Ready_To_Post Snapshot ---
+# In-memory copy of Ready_To_Post loaded with a single get_all_values() call:
+# the header -> column map, a Post_ID -> row map and the row contents. It is
+# reloaded after READY_TO_POST_CACHE_TTL_SECONDS, on a Post_ID miss, or when a
+# row read back from the sheet no longer holds the Post_ID we expected.
+_ready_lock = threading.RLock()
+_ready_cache = {
+    'loaded_at': None,
+    'headers': [],
+    'columns': {},
+    'row_by_post_id': {},
+    'rows': {},
+}
+
+def _reload_ready_to_post_snapshot(sheet):
+    worksheet = get_worksheet(sheet, READY_TO_POST_WORKSHEET_NAME)
+    all_values = sheets_call('read', worksheet.get_all_values)
+    headers = all_values[0] if all_values else []
+    columns = {name: index + 1 for index, name in enumerate(headers) if name}
+    post_id_col = columns.get('Post_ID')
+
+    rows = {}
+    row_by_post_id = {}
+    for row_number, values in enumerate(all_values[1:], start=2):
+        rows[row_number] = values
+        if post_id_col and len(values) >= post_id_col:
+            row_post_id = values[post_id_col - 1].strip()
+            if row_post_id and row_post_id not in row_by_post_id: # Same as find(): first match wins
+                row_by_post_id[row_post_id] = row_number
+
+    # Buffered writes that haven't reached the sheet yet still count as the row's state.
+    for row_post_id, pending in get_all_pending_ready_values().items():
+        row_number = row_by_post_id.get(row_post_id)
+        if row_number is None:
+            continue
+        for header, value in pending.items():
+            col = columns.get(header)
+            if col:
+                row = rows[row_number]
+                if len(row) < col:
+                    row.extend([''] * (col - len(row)))
+                row[col - 1] = value
+
+    _ready_cache['loaded_at'] = time.monotonic()
+    _ready_cache['headers'] = headers
+    _ready_cache['columns'] = columns
+    _ready_cache['row_by_post_id'] = row_by_post_id
+    _ready_cache['rows'] = rows
+    logger.info(f"Loaded {READY_TO_POST_WORKSHEET_NAME} snapshot: {len(rows)} rows, {len(row_by_post_id)} Post_IDs.")
+
+def _ready_snapshot_age():
+    if _ready_cache['loaded_at'] is None:
         return None
+    return time.monotonic() - _ready_cache['loaded_at']
+
+def refresh_ready_to_post_snapshot(sheet, force=False):
+    """Reloads the Ready_To_Post snapshot if it is missing, older than the TTL, or `force` is set."""
+    with _ready_lock:
+        age = _ready_snapshot_age()
+        if force or age is None or age > READY_TO_POST_CACHE_TTL_SECONDS:
+            _reload_ready_to_post_snapshot(sheet)
+
+def invalidate_ready_to_post_snapshot():
+    """Forces the next snapshot access to reload Ready_To_Post."""
+    with _ready_lock:
+        _ready_cache['loaded_at'] = None
+
+def get_ready_to_post_headers(sheet):
+    """Returns the cached Ready_To_Post header row."""
+    with _ready_lock:
+        refresh_ready_to_post_snapshot(sheet)
+        return list(_ready_cache['headers'])
+
+def get_ready_to_post_columns(sheet):
+    """Returns the cached {header: 1-based column} map for Ready_To_Post."""
+    with _ready_lock:
+        refresh_ready_to_post_snapshot(sheet)
+        return dict(_ready_cache['columns'])
+
+def find_post_row(sheet, post_id, force_refresh=False):
+    """Returns the row number holding `post_id`, reloading the snapshot once on a miss."""
+    key = str(post_id).strip()
+    with _ready_lock:
+        refresh_ready_to_post_snapshot(sheet, force=force_refresh)
+        row_number = _ready_cache['row_by_post_id'].get(key)
+        if row_number is None and not force_refresh:
+            age = _ready_snapshot_age()
+            if age is None or age >= READY_TO_POST_MIN_RELOAD_SECONDS:
+                logger.info(f"Post_ID '{key}' not in cached snapshot. Reloading {READY_TO_POST_WORKSHEET_NAME}...")
+                _reload_ready_to_post_snapshot(sheet)
+                row_number = _ready_cache['row_by_post_id'].get(key)
+        return row_number
+
+def get_cached_ready_rows(sheet):
+    """Returns [(row_number, {header: value})] for every data row in the snapshot."""
+    with _ready_lock:
+        refresh_ready_to_post_snapshot(sheet)
+        headers = _ready_cache['headers']
+        return [(row_number, dict(zip(headers, values))) for row_number, values in sorted(_ready_cache['rows'].items())]
+
+def _remember_ready_row(row_index, row_values):
+    with _ready_lock:
+        if _ready_cache['loaded_at'] is not None:
+            _ready_cache['rows'][row_index] = list(row_values)
+
+def _remember_ready_cells(row_index, values_by_col):
+    """Mirrors our own writes into the snapshot so it doesn't go stale until the next reload."""
+    with _ready_lock:
+        if _ready_cache['loaded_at'] is None:
+            return
+        row = list(_ready_cache['rows'].get(row_index, []))
+        for col, value in values_by_col.items():
+            if len(row) < col:
+                row.extend([''] * (col - len(row)))
+            row[col - 1] = value
+        _ready_cache['rows'][row_index] = row
 
 def get_post_data(sheet, post_id):
     """Reads a specific row from the Ready_To_Post sheet by Post_ID."""
     try:
-        print(f"LOG: Attempting to access worksheet: {READY_TO_POST_WORKSHEET_NAME}")
-        worksheet = sheet.worksheet(READY_TO_POST_WORKSHEET_NAME)
-        print(f"LOG: Successfully accessed worksheet: {READY_TO_POST_WORKSHEET_NAME}")
+        logger.info(f"Attempting to access worksheet: {READY_TO_POST_WORKSHEET_NAME}")
+        worksheet = get_worksheet(sheet, READY_TO_POST_WORKSHEET_NAME)
+        logger.info(f"Successfully accessed worksheet: {READY_TO_POST_WORKSHEET_NAME}")
 
-        headers = worksheet.row_values(1)
-        print(f"LOG: Sheet headers: {headers}")
+        headers = get_ready_to_post_headers(sheet)
+        log_payload("Sheet headers: %s", headers)
 
         if 'Post_ID' not in headers:
-            print(f"ERROR: 'Post_ID' header not found in worksheet '{READY_TO_POST_WORKSHEET_NAME}'. Available headers: {headers}", file=sys.stderr)
+            logger.error(f"'Post_ID' header not found in worksheet '{READY_TO_POST_WORKSHEET_NAME}'. Available headers: {headers}")
             return None, None
 
-        post_id_col_index = headers.index('Post_ID') + 1
-        print(f"LOG: Attempting to find Post_ID '{post_id}' in column {post_id_col_index}...")
+        post_id_key = str(post_id).strip()
+        row_index = find_post_row(sheet, post_id)
+        post_data = None
+        for attempt in range(2):
+            if row_index is None:
+                break
+            # The row itself is always read fresh: the snapshot only tells us where to look.
+            row_values = sheets_call('read', worksheet.row_values, row_index)
+            post_data = dict(zip(headers, row_values))
+            if post_data.get('Post_ID', '').strip() == post_id_key:
+                _remember_ready_row(row_index, row_values)
+                post_data.update(get_pending_ready_values(post_id_key))
+                break
+            logger.warning(f"Row {row_index} no longer holds Post_ID '{post_id}' (rows moved?). Reloading snapshot.")
+            post_data = None
+            row_index = find_post_row(sheet, post_id, force_refresh=True)
+            headers = get_ready_to_post_headers(sheet)
 
-        try:
-            cell = worksheet.find(str(post_id), in_column=post_id_col_index)
-        except gspread.exceptions.CellNotFound:
-            cell = None # Handle gracefully if find raises an exception instead of returning None
-
-        if not cell:
-            print(f"ERROR: Post_ID '{post_id}' not found in column 'Post_ID' of {READY_TO_POST_WORKSHEET_NAME}.", file=sys.stderr)
+        if not post_data:
+            logger.error(f"Post_ID '{post_id}' not found in column 'Post_ID' of {READY_TO_POST_WORKSHEET_NAME}.")
             return None, None
 
-        print(f"LOG: Found Post_ID '{post_id}' at row {cell.row}.")
-        row_values = worksheet.row_values(cell.row)
-        post_data = dict(zip(headers, row_values))
+        logger.info(f"Found Post_ID '{post_id}' at row {row_index}.")
 
-        if post_data.get('Status') != 'Ready':
-            print(f"WARNING: Post_ID '{post_id}' status is '{post_data.get('Status')}', not 'Ready'. Skipping.", file=sys.stderr)
-            return None, cell.row
+        if not is_row_claimable(post_data):
+            logger.warning(f"Post_ID '{post_id}' status is '{post_data.get('Status')}', not 'Ready'. Skipping.")
+            return None, row_index
         
-        print(f"LOG: Post {post_id} is Ready. Data loaded: {post_data}")
-        return post_data, cell.row
+        logger.info(f"Post {post_id} is Ready.")
+        log_payload("Post %s data loaded: %s", post_id, post_data)
+        return post_data, row_index
     except gspread.exceptions.WorksheetNotFound:
-        print(f"ERROR: Worksheet '{READY_TO_POST_WORKSHEET_NAME}' not found.", file=sys.stderr)
+        logger.error(f"Worksheet '{READY_TO_POST_WORKSHEET_NAME}' not found.")
         return None, None
     except Exception as e:
-        print(f"ERROR: Exception in get_post_data for Post_ID {post_id}: {e}", file=sys.stderr)
-        traceback.print_exc(file=sys.stderr)
+        handle_sheets_error(e)
+        logger.exception(f"Exception in get_post_data for Post_ID {post_id}: {e}")
         return None, None
 
-def update_post_status(sheet, row_index, status, threads_post_id=None, notes=None):
-    """Updates the Status, Threads_Post_ID, and Notes columns for a row in Ready_To_Post."""
+@timed_function('status_write')
+def update_post_status(sheet, row_index, status, threads_post_id=None, notes=None, post_id=None):
+    """Updates the Status, Threads_Post_ID, and Notes columns for a row in Ready_To_Post.
+
+    When SHEETS_WRITE_BEHIND is on and `post_id` is given, the write is journaled
+    and buffered instead of being sent to Sheets before returning.
+    """
+    if SHEETS_WRITE_BEHIND and post_id is not None:
+        values = {'Status': status}
+        if threads_post_id:
+            values['Threads_Post_ID'] = str(threads_post_id)
+        if notes:
+            values['Notes'] = notes
+        queue_ready_row_update(post_id, row_index, values)
+        return
     try:
-        print(f"LOG: Attempting to update row {row_index} in {READY_TO_POST_WORKSHEET_NAME} to Status: '{status}'")
-        worksheet = sheet.worksheet(READY_TO_POST_WORKSHEET_NAME)
-        header_row = worksheet.row_values(1)
+        logger.info(f"Attempting to update row {row_index} in {READY_TO_POST_WORKSHEET_NAME} to Status: '{status}'")
+        worksheet = get_worksheet(sheet, READY_TO_POST_WORKSHEET_NAME)
+        columns = get_ready_to_post_columns(sheet)
 
         update_cells_list = []
-        if 'Status' in header_row:
-            status_col = header_row.index('Status') + 1
-            update_cells_list.append(gspread.Cell(row_index, status_col, status))
+        if 'Status' in columns:
+            update_cells_list.append(gspread.Cell(row_index, columns['Status'], status))
         else:
-            print(f"WARNING: 'Status' column not found in {READY_TO_POST_WORKSHEET_NAME} for update.", file=sys.stderr)
+            logger.warning(f"'Status' column not found in {READY_TO_POST_WORKSHEET_NAME} for update.")
 
-        if threads_post_id and 'Threads_Post_ID' in header_row:
-            threads_id_col = header_row.index('Threads_Post_ID') + 1
-            update_cells_list.append(gspread.Cell(row_index, threads_id_col, str(threads_post_id)))
+        if threads_post_id and 'Threads_Post_ID' in columns:
+            update_cells_list.append(gspread.Cell(row_index, columns['Threads_Post_ID'], str(threads_post_id)))
         elif threads_post_id:
-             print(f"WARNING: 'Threads_Post_ID' column not found in {READY_TO_POST_WORKSHEET_NAME} for update.", file=sys.stderr)
+             logger.warning(f"'Threads_Post_ID' column not found in {READY_TO_POST_WORKSHEET_NAME} for update.")
 
-        if notes and 'Notes' in header_row:
-            notes_col = header_row.index('Notes') + 1
-            update_cells_list.append(gspread.Cell(row_index, notes_col, notes))
+        if notes and 'Notes' in columns:
+            update_cells_list.append(gspread.Cell(row_index, columns['Notes'], notes))
         elif notes:
-            print(f"WARNING: 'Notes' column not found in {READY_TO_POST_WORKSHEET_NAME} for update.", file=sys.stderr)
+            logger.warning(f"'Notes' column not found in {READY_TO_POST_WORKSHEET_NAME} for update.")
 
         if update_cells_list:
-            worksheet.update_cells(update_cells_list)
-            print(f"LOG: Successfully updated {READY_TO_POST_WORKSHEET_NAME} for row {row_index}.")
+            sheets_call('write', worksheet.update_cells, update_cells_list)
+            _remember_ready_cells(row_index, {cell.col: cell.value for cell in update_cells_list})
+            logger.info(f"Successfully updated {READY_TO_POST_WORKSHEET_NAME} for row {row_index}.")
         else:
-            print(f"LOG: No valid columns found or values provided to update in {READY_TO_POST_WORKSHEET_NAME} for row {row_index}.")
+            logger.info(f"No valid columns found or values provided to update in {READY_TO_POST_WORKSHEET_NAME} for row {row_index}.")
+
+    except Exception as e:
+        handle_sheets_error(e)
+        logger.exception(f"Exception in update_post_status for row {row_index}: {e}")
+
+def build_posted_log_row(original_post_id, threads_post_id, account_name, timestamp_posted):
+    # This order must match your "Posted_Logs" sheet columns:
+    # Original_Post_ID, Threads_Post_ID, Account, Timestamp_Posted, Insights_Last_Checked, Views, Likes, Replies
+    return [
+        original_post_id,     # e.g., TEST-001
+        str(threads_post_id), # The ID from Threads API
+        account_name,
+        timestamp_posted,     # ISO format string
+        '',                   # Insights_Last_Checked (initially blank)
+        '',                   # Views (initially blank)
+        '',                   # Likes (initially blank)
+        ''                    # Replies (initially blank)
+        # Add more empty strings if you have more metric columns in "Posted_Logs"
+    ]
+
+@timed_function('status_write')
+def update_ready_rows(sheet, row_updates):
+    """Writes many Ready_To_Post rows in one batch_update call.
+
+    `row_updates` is a list of (row_index, {header: value}). Headers missing from
+    the sheet are skipped with a warning. Returns True if the write succeeded.
+    """
+    try:
+        worksheet = get_worksheet(sheet, READY_TO_POST_WORKSHEET_NAME)
+        columns = get_ready_to_post_columns(sheet)
+        data = []
+        written = []
+        for row_index, values in row_updates:
+            values_by_col = {}
+            for header, value in values.items():
+                if header not in columns:
+                    logger.warning(f"'{header}' column not found in {READY_TO_POST_WORKSHEET_NAME} for update.")
+                    continue
+                col = columns[header]
+                data.append({'range': gspread.utils.rowcol_to_a1(row_index, col), 'values': [[value]]})
+                values_by_col[col] = value
+            written.append((row_index, values_by_col))
+        if not data:
+            return True
+        sheets_call('write', worksheet.batch_update, data)
+        for row_index, values_by_col in written:
+            _remember_ready_cells(row_index, values_by_col)
+        logger.info(f"Batch-updated {len(data)} cells across {len(row_updates)} rows in {READY_TO_POST_WORKSHEET_NAME}.")
+        return True
+    except Exception as e:
+        handle_sheets_error(e)
+        logger.exception(f"Exception in update_ready_rows for {len(row_updates)} rows: {e}")
+        return False
 
+@timed_function('log_append')
+def log_many_to_posted_sheet(sheet, log_rows):
+    """Appends many build_posted_log_row() rows to Posted_Logs in one append_rows call."""
+    if not log_rows:
+        return True
+    try:
+        worksheet = get_worksheet(sheet, POSTED_LOGS_WORKSHEET_NAME)
+        sheets_call('write', worksheet.append_rows, log_rows, value_input_option='USER_ENTERED')
+        logger.info(f"Successfully appended {len(log_rows)} rows to {POSTED_LOGS_WORKSHEET_NAME}.")
+        return True
+    except gspread.exceptions.WorksheetNotFound:
+        logger.error(f"Worksheet '{POSTED_LOGS_WORKSHEET_NAME}' not found. Please ensure it exists with this exact name.")
+        return False
     except Exception as e:
-        print(f"ERROR: Exception in update_post_status for row {row_index}: {e}", file=sys.stderr)
-        traceback.print_exc(file=sys.stderr)
+        handle_sheets_error(e)
+        logger.exception(f"Exception in log_many_to_posted_sheet for {len(log_rows)} rows: {e}")
+        return False
+
+# --- Write-Behind Sheets Buffer ---
+# Status and Posted_Logs writes are appended to a local journal (fsynced) and
+# buffered in memory, then flushed by a background thread every
+# SHEETS_FLUSH_INTERVAL_SECONDS or once SHEETS_FLUSH_MAX_PENDING writes are
+# waiting. Repeated writes to the same Post_ID/column collapse to the last value.
+# Ready_To_Post writes are keyed by Post_ID and resolved to a row at flush time,
+# so they still land correctly if rows moved. After each flush the journal is
+# rewritten to hold only what is still pending; at startup it is replayed.
+_writer_lock = threading.Lock()
+_writer_wakeup = threading.Condition(_writer_lock)
+_writer_start_lock = threading.Lock()
+_writer_state = {'started': False, 'seq': 0}
+_pending_cells = OrderedDict() # (post_id, header) -> journal entry
+_pending_appends = [] # journal entries for Posted_Logs rows
+
+def _journal_write(entries):
+    with open(SHEETS_JOURNAL_PATH, 'a', encoding='utf-8') as journal:
+        for entry in entries:
+            journal.write(json.dumps(entry) + '\n')
+        journal.flush()
+        os.fsync(journal.fileno())
+
+def _compact_journal():
+    """Rewrites the journal with only the still-pending entries. Caller holds _writer_lock."""
+    entries = list(_pending_cells.values()) + list(_pending_appends)
+    if not entries:
+        if os.path.exists(SHEETS_JOURNAL_PATH):
+            open(SHEETS_JOURNAL_PATH, 'w').close()
+        return
+    tmp_path = f"{SHEETS_JOURNAL_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as journal:
+        for entry in entries:
+            journal.write(json.dumps(entry) + '\n')
+        journal.flush()
+        os.fsync(journal.fileno())
+    os.replace(tmp_path, SHEETS_JOURNAL_PATH)
+
+def _buffer_entry(entry):
+    """Adds a journal entry to the in-memory buffer. Caller holds _writer_lock."""
+    _writer_state['seq'] = max(_writer_state['seq'], entry['seq'])
+    if entry['kind'] == 'cell':
+        key = (entry['post_id'], entry['header'])
+        _pending_cells.pop(key, None) # Re-insert so flush order follows the latest write
+        _pending_cells[key] = entry
+    else:
+        _pending_appends.append(entry)
+
+def _pending_count():
+    return len(_pending_cells) + len(_pending_appends)
+
+def queue_ready_row_update(post_id, row_index, values):
+    """Journals and buffers {header: value} writes for the Ready_To_Post row holding `post_id`."""
+    ensure_sheets_writer_started()
+    post_id = str(post_id).strip()
+    with _writer_lock:
+        entries = []
+        for header, value in values.items():
+            _writer_state['seq'] += 1
+            entries.append({'seq': _writer_state['seq'], 'kind': 'cell', 'post_id': post_id, 'row_hint': row_index, 'header': header, 'value': value})
+        _journal_write(entries)
+        for entry in entries:
+            _buffer_entry(entry)
+        if _pending_count() >= SHEETS_FLUSH_MAX_PENDING:
+            _writer_wakeup.notify()
+    # Outside _writer_lock: the snapshot lock is taken in the other order on reload.
+    columns = _ready_cache['columns']
+    _remember_ready_cells(row_index, {columns[h]: v for h, v in values.items() if h in columns})
+    logger.info(f"Buffered {READY_TO_POST_WORKSHEET_NAME} write for Post_ID {post_id}: {values}")
+
+def queue_posted_log_row(log_row):
+    """Journals and buffers one Posted_Logs row."""
+    ensure_sheets_writer_started()
+    with _writer_lock:
+        _writer_state['seq'] += 1
+        entry = {'seq': _writer_state['seq'], 'kind': 'append', 'worksheet': POSTED_LOGS_WORKSHEET_NAME, 'row': log_row}
+        _journal_write([entry])
+        _buffer_entry(entry)
+        if _pending_count() >= SHEETS_FLUSH_MAX_PENDING:
+            _writer_wakeup.notify()
+    logger.info(f"Buffered {POSTED_LOGS_WORKSHEET_NAME} row for Original_Post_ID: {log_row[0]}")
+
+def get_pending_ready_values(post_id):
+    """Returns {header: value} for buffered writes to `post_id` that haven't been flushed yet."""
+    post_id = str(post_id).strip()
+    with _writer_lock:
+        return {header: entry['value'] for (pending_post_id, header), entry in _pending_cells.items() if pending_post_id == post_id}
+
+def get_all_pending_ready_values():
+    """Returns {post_id: {header: value}} for every buffered Ready_To_Post write."""
+    with _writer_lock:
+        pending = {}
+        for (post_id, header), entry in _pending_cells.items():
+            pending.setdefault(post_id, {})[header] = entry['value']
+        return pending
+
+def write_ready_rows(sheet, post_row_updates):
+    """Writes [(post_id, row_index, {header: value})] through the buffer, or straight to Sheets when it is off."""
+    if SHEETS_WRITE_BEHIND:
+        for post_id, row_index, values in post_row_updates:
+            queue_ready_row_update(post_id, row_index, values)
+        return True
+    return update_ready_rows(sheet, [(row_index, values) for _, row_index, values in post_row_updates])
+
+def write_posted_logs(sheet, log_rows):
+    """Writes Posted_Logs rows through the buffer, or straight to Sheets when it is off."""
+    if SHEETS_WRITE_BEHIND:
+        for log_row in log_rows:
+            queue_posted_log_row(log_row)
+        return True
+    return log_many_to_posted_sheet(sheet, log_rows)
+
+def _resolve_flush_rows(sheet, post_ids):
+    """Returns {post_id: row_index} for the buffered Post_IDs still in Ready_To_Post.
+
+    Rows are never taken from the row number seen when a write was buffered:
+    that row may now hold a different post. A snapshot younger than
+    READY_TO_POST_CACHE_TTL_SECONDS is used if it knows every Post_ID and one
+    batch_get() of the target rows' Post_ID cells confirms them; otherwise
+    (or on any mismatch) the whole sheet is re-read.
+    """
+    with _ready_lock:
+        age = _ready_snapshot_age()
+        rows = {post_id: _ready_cache['row_by_post_id'].get(post_id) for post_id in post_ids}
+    columns = get_ready_to_post_columns(sheet)
+    if age is not None and age < READY_TO_POST_CACHE_TTL_SECONDS and all(rows.values()) and 'Post_ID' in columns:
+        worksheet = get_worksheet(sheet, READY_TO_POST_WORKSHEET_NAME)
+        targets = list(rows.items())
+        ranges = [gspread.utils.rowcol_to_a1(row_index, columns['Post_ID']) for _, row_index in targets]
+        cells = sheets_call('read', worksheet.batch_get, ranges)
+        moved = [
+            post_id for (post_id, _), cell in zip(targets, cells)
+            if str(cell[0][0] if cell and cell[0] else '').strip() != post_id
+        ]
+        if not moved:
+            return rows
+        logger.info(f"Post_IDs {moved} moved since the {READY_TO_POST_WORKSHEET_NAME} snapshot. Reloading it before flushing.")
+    refresh_ready_to_post_snapshot(sheet, force=True)
+    with _ready_lock:
+        return {post_id: _ready_cache['row_by_post_id'][post_id] for post_id in post_ids if post_id in _ready_cache['row_by_post_id']}
+
+@timed_function('sheets_flush')
+def flush_sheets_writes():
+    """Sends everything buffered to Sheets. Returns True when nothing is left pending."""
+    with _writer_lock:
+        cells = list(_pending_cells.values())
+        appends = list(_pending_appends)
+    if not cells and not appends:
+        return True
+    sheet = get_google_sheet_client()
+    if not sheet:
+        logger.error(f"Cannot flush {len(cells) + len(appends)} buffered Sheets writes: no Sheets connection.")
+        return False
+
+    ok = True
+    if cells:
+        try:
+            row_by_post_id = _resolve_flush_rows(sheet, {entry['post_id'] for entry in cells})
+        except Exception as e:
+            handle_sheets_error(e)
+            logger.error(f"Cannot flush {len(cells)} buffered {READY_TO_POST_WORKSHEET_NAME} writes: could not re-read the sheet: {e}")
+            return False
+        row_updates = {}
+        dropped = []
+        for entry in cells:
+            row_index = row_by_post_id.get(entry['post_id'])
+            if row_index is None:
+                logger.error(f"Post_ID {entry['post_id']} is no longer in {READY_TO_POST_WORKSHEET_NAME}. Dropping buffered write {entry['header']}={entry['value']!r}.")
+                dropped.append(entry)
+                continue
+            row_updates.setdefault(row_index, {})[entry['header']] = entry['value']
+        written = update_ready_rows(sheet, list(row_updates.items())) if row_updates else True
+        if not written:
+            ok = False
+        with _writer_lock:
+            for entry in (cells if written else dropped):
+                key = (entry['post_id'], entry['header'])
+                if _pending_cells.get(key) is entry: # A newer write to the same cell stays pending
+                    del _pending_cells[key]
+    if appends:
+        if log_many_to_posted_sheet(sheet, [entry['row'] for entry in appends]):
+            flushed = {id(entry) for entry in appends}
+            with _writer_lock:
+                _pending_appends[:] = [entry for entry in _pending_appends if id(entry) not in flushed]
+        else:
+            ok = False
+
+    with _writer_lock:
+        _compact_journal()
+        return ok and _pending_count() == 0
+
+def replay_sheets_journal():
+    """Loads writes left in the journal by a previous process back into the buffer."""
+    if not os.path.exists(SHEETS_JOURNAL_PATH):
+        return 0
+    replayed = 0
+    with _writer_lock:
+        with open(SHEETS_JOURNAL_PATH, encoding='utf-8') as journal:
+            for line in journal:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    _buffer_entry(json.loads(line))
+                    replayed += 1
+                except (ValueError, KeyError) as e: # A torn last line from a crash mid-write
+                    logger.warning(f"Skipping unreadable journal line in {SHEETS_JOURNAL_PATH}: {e}")
+        _compact_journal()
+    if replayed:
+        logger.info(f"Replayed {replayed} unflushed Sheets writes from {SHEETS_JOURNAL_PATH}.")
+    return replayed
+
+def _sheets_writer_loop():
+    failures = 0
+    while True:
+        with _writer_lock:
+            wait_seconds = min(SHEETS_FLUSH_INTERVAL_SECONDS * (2 ** failures), 60)
+            _writer_wakeup.wait(timeout=wait_seconds)
+        try:
+            failures = 0 if flush_sheets_writes() else failures + 1
+        except Exception as e:
+            failures += 1
+            logger.exception(f"Unexpected error flushing Sheets writes: {e}")
+
+def ensure_sheets_writer_started():
+    """Replays the journal and starts the background flusher once per process."""
+    if _writer_state['started'] or not SHEETS_WRITE_BEHIND:
+        return
+    with _writer_start_lock:
+        if _writer_state['started']:
+            return
+        _writer_state['started'] = True
+        replay_sheets_journal()
+        threading.Thread(target=_sheets_writer_loop, name='sheets-writer', daemon=True).start()
+        atexit.register(flush_sheets_writes)
+        logger.info(f"Started Sheets write-behind flusher (journal: {SHEETS_JOURNAL_PATH}).")
 
 # --- NEW --- Function to log to "Posted_Logs" sheet
+@timed_function('log_append')
 def log_to_posted_sheet(sheet, original_post_id, threads_post_id, account_name, timestamp_posted):
-    """Appends a new row to the Posted_Logs sheet."""
-    try:
-        print(f"LOG: Attempting to log to worksheet: {POSTED_LOGS_WORKSHEET_NAME}")
-        worksheet = sheet.worksheet(POSTED_LOGS_WORKSHEET_NAME)
-        print(f"LOG: Successfully accessed worksheet: {POSTED_LOGS_WORKSHEET_NAME}")
-
-        # This order must match your "Posted_Logs" sheet columns:
-        # Original_Post_ID, Threads_Post_ID, Account, Timestamp_Posted, Insights_Last_Checked, Views, Likes, Replies
-        row_to_append = [
-            original_post_id,     # e.g., TEST-001
-            str(threads_post_id), # The ID from Threads API
-            account_name,
-            timestamp_posted,     # ISO format string
-            '',                   # Insights_Last_Checked (initially blank)
-            '',                   # Views (initially blank)
-            '',                   # Likes (initially blank)
-            ''                    # Replies (initially blank)
-            # Add more empty strings if you have more metric columns in "Posted_Logs"
-        ]
+    """Appends a new row to the Posted_Logs sheet (buffered when SHEETS_WRITE_BEHIND is on)."""
+    if SHEETS_WRITE_BEHIND:
+        queue_posted_log_row(build_posted_log_row(original_post_id, threads_post_id, account_name, timestamp_posted))
+        return True
+    try:
+        logger.info(f"Attempting to log to worksheet: {POSTED_LOGS_WORKSHEET_NAME}")
+        worksheet = get_worksheet(sheet, POSTED_LOGS_WORKSHEET_NAME)
+        logger.info(f"Successfully accessed worksheet: {POSTED_LOGS_WORKSHEET_NAME}")
+
+        row_to_append = build_posted_log_row(original_post_id, threads_post_id, account_name, timestamp_posted)
         
-        worksheet.append_row(row_to_append, value_input_option='USER_ENTERED')
-        print(f"LOG: Successfully appended to {POSTED_LOGS_WORKSHEET_NAME} for Original_Post_ID: {original_post_id}, Threads_Post_ID: {threads_post_id}")
+        sheets_call('write', worksheet.append_row, row_to_append, value_input_option='USER_ENTERED')
+        logger.info(f"Successfully appended to {POSTED_LOGS_WORKSHEET_NAME} for Original_Post_ID: {original_post_id}, Threads_Post_ID: {threads_post_id}")
         return True
     except gspread.exceptions.WorksheetNotFound:
-        print(f"ERROR: Worksheet '{POSTED_LOGS_WORKSHEET_NAME}' not found. Please ensure it exists with this exact name.", file=sys.stderr)
+        logger.error(f"Worksheet '{POSTED_LOGS_WORKSHEET_NAME}' not found. Please ensure it exists with this exact name.")
         return False
     except Exception as e:
-        print(f"ERROR: Exception in log_to_posted_sheet for Original_Post_ID {original_post_id}: {e}", file=sys.stderr)
-        traceback.print_exc(file=sys.stderr)
+        handle_sheets_error(e)
+        logger.exception(f"Exception in log_to_posted_sheet for Original_Post_ID {original_post_id}: {e}")
         return False
 
-def make_threads_api_request(endpoint, method='POST', params=None, data=None, headers=None, retries=3, delay=10):
-    """Makes a request to the Threads API with retry logic."""
+# --- Pooled HTTP Sessions ---
+# One keep-alive requests.Session per host, shared by every thread, so posting
+# and insights calls reuse TCP+TLS connections to graph.threads.net instead of
+# handshaking on each request.
+_http_sessions_lock = threading.Lock()
+_http_sessions = {}
+
+def get_http_session(url):
+    """Returns the shared pooled session for the host of `url`."""
+    parts = urlsplit(url)
+    host_key = f"{parts.scheme}://{parts.netloc}"
+    with _http_sessions_lock:
+        session = _http_sessions.get(host_key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_MAXSIZE, pool_block=HTTP_POOL_BLOCK)
+            session.mount(f"{host_key}/", adapter)
+            _http_sessions[host_key] = session
+            logger.info(f"Created pooled HTTP session for {host_key} (pool size {HTTP_POOL_MAXSIZE}).")
+        return session
+
+def get_http_timeout(read_timeout=None):
+    """Returns a (connect, read) timeout tuple for requests."""
+    return (HTTP_CONNECT_TIMEOUT_SECONDS, read_timeout if read_timeout is not None else HTTP_READ_TIMEOUT_SECONDS)
+
+_token_accounts = {}
+
+def account_for_access_token(access_token):
+    """Maps an access token back to its THREADS_ACCESS_TOKEN_<NAME> account name (for per-account buckets)."""
+    account = _token_accounts.get(access_token)
+    if account is None:
+        for env_name, env_value in os.environ.items():
+            if env_name.startswith('THREADS_ACCESS_TOKEN_') and env_value == access_token:
+                account = env_name[len('THREADS_ACCESS_TOKEN_'):]
+                break
+        else:
+            account = 'UNKNOWN'
+        _token_accounts[access_token] = account
+    return account
+
+def _threads_endpoint_label(endpoint):
+    """Low-cardinality metrics label for a Graph endpoint path (IDs stripped)."""
+    tail = endpoint.rsplit('/', 1)[-1] if '/' in endpoint else ''
+    return tail if tail in ('threads', 'threads_publish', 'insights') else 'media'
+
+def make_threads_api_request(endpoint, method='POST', params=None, data=None, headers=None, retries=3, delay=None):
+    """Makes a request to the Threads API under the account's rate bucket.
+
+    Retryable failures (429, 5xx, Graph rate-limit codes, network errors) are
+    retried with jittered exponential backoff starting at `delay` seconds
+    (RETRY_BASE_DELAY_SECONDS by default), honouring Retry-After. Terminal
+    errors such as validation 400s return None straight away.
+    """
     url = f"{THREADS_API_BASE_URL}{endpoint}"
+    if method.upper() not in ('POST', 'GET'):
+        logger.error(f"Unsupported HTTP method '{method}' for make_threads_api_request.")
+        return None
+    account = account_for_access_token((params or {}).get('access_token'))
+    bucket = get_rate_bucket(f"threads:{account}")
+    endpoint_label = _threads_endpoint_label(endpoint)
     attempt = 0
     while attempt < retries:
+        retry_after = None
         try:
-            print(f"LOG: API Call Attempt {attempt + 1}/{retries} to {method} {url}")
+            bucket.acquire()
+            logger.info(f"API Call Attempt {attempt + 1}/{retries} to {method} {url}")
+            session = get_http_session(url)
+            started = time.perf_counter()
             if method.upper() == 'POST':
-                response = requests.post(url, params=params, json=data, headers=headers, timeout=60)
-            elif method.upper() == 'GET':
-                 response = requests.get(url, params=params, headers=headers, timeout=60)
+                response = session.post(url, params=params, json=data, headers=headers, timeout=get_http_timeout())
             else:
-                print(f"ERROR: Unsupported HTTP method '{method}' for make_threads_api_request.", file=sys.stderr)
-                return None
+                 response = session.get(url, params=params, headers=headers, timeout=get_http_timeout())
             
-            print(f"LOG: API Response Status: {response.status_code}")
+            record_outbound_call('threads', endpoint_label, time.perf_counter() - started, 'ok' if response.status_code < 400 else f'http_{response.status_code}', account=account)
+            logger.info(f"API Response Status: {response.status_code}")
             response.raise_for_status() 
             return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"ERROR: API request failed (Attempt {attempt + 1}/{retries}): {e}", file=sys.stderr)
-            attempt += 1
-            if attempt < retries:
-                print(f"LOG: Retrying in {delay} seconds...", file=sys.stderr)
-                time.sleep(delay)
-            else:
-                print(f"ERROR: Max retries reached for {url}. Giving up.", file=sys.stderr)
+        except requests.exceptions.HTTPError as e:
+            response = e.response
+            try:
+                error_body = response.json()
+            except ValueError:
+                error_body = None
+            logger.error(f"API request failed (Attempt {attempt + 1}/{retries}): {e} - Response: {error_body or response.text[:500]}")
+            if not is_retryable_http_error(response.status_code, error_body):
+                logger.error(f"Non-retryable error from {url}. Giving up.")
                 return None
+            retry_after = parse_retry_after(response)
+            error_code = error_body.get('error', {}).get('code') if isinstance(error_body, dict) and isinstance(error_body.get('error'), dict) else None
+            if response.status_code == 429 or retry_after is not None or error_code in THREADS_RATE_LIMIT_ERROR_CODES:
+                bucket.pause(retry_after if retry_after is not None else backoff_delay(attempt, base_delay=delay))
+        except requests.exceptions.RequestException as e:
+            record_outbound_call('threads', endpoint_label, time.perf_counter() - started, 'network_error', account=account)
+            logger.error(f"API request failed (Attempt {attempt + 1}/{retries}): {e}")
         except Exception as e:
-             print(f"ERROR: An unexpected error occurred during API request (Attempt {attempt + 1}/{retries}): {e}", file=sys.stderr)
-             traceback.print_exc(file=sys.stderr)
-             attempt += 1
-             if attempt < retries:
-                 print(f"LOG: Retrying in {delay} seconds...", file=sys.stderr)
-                 time.sleep(delay)
-             else:
-                 print(f"ERROR: Max retries reached for {url} after unexpected error. Giving up.", file=sys.stderr)
-                 return None
+             logger.exception(f"An unexpected error occurred during API request (Attempt {attempt + 1}/{retries}): {e}")
+        attempt += 1
+        if attempt < retries:
+            wait = backoff_delay(attempt - 1, retry_after, base_delay=delay)
+            logger.info(f"Retrying in {wait:.1f} seconds...")
+            time.sleep(wait)
+        else:
+            logger.error(f"Max retries reached for {url}. Giving up.")
     return None
 
 def create_threads_container(user_id, access_token, text_content, reply_to_id=None):
@@ -212,12 +1190,12 @@ def create_threads_container(user_id, access_token, text_content, reply_to_id=No
     }
     if reply_to_id:
         params['reply_to_id'] = reply_to_id
-    print(f"LOG: Creating container for user {user_id}, reply_to: {reply_to_id}")
+    logger.info(f"Creating container for user {user_id}, reply_to: {reply_to_id}")
     response_data = make_threads_api_request(endpoint, method='POST', params=params)
     if response_data and 'id' in response_data:
-        print(f"LOG: Created container with ID: {response_data['id']}")
+        logger.info(f"Created container with ID: {response_data['id']}")
         return response_data['id']
-    print(f"ERROR: Failed to create container. Response: {response_data}", file=sys.stderr)
+    logger.error(f"Failed to create container. Response: {response_data}")
     return None
 
 def publish_threads_container(user_id, access_token, creation_id):
@@ -226,98 +1204,279 @@ def publish_threads_container(user_id, access_token, creation_id):
         'creation_id': creation_id,
         'access_token': access_token
     }
-    print(f"LOG: Publishing container {creation_id} for user {user_id}")
+    logger.info(f"Publishing container {creation_id} for user {user_id}")
     response_data = make_threads_api_request(endpoint, method='POST', params=params)
     if response_data and 'id' in response_data:
-        print(f"LOG: Published container with Media ID: {response_data['id']}")
+        logger.info(f"Published container with Media ID: {response_data['id']}")
         return response_data['id']
-    print(f"ERROR: Failed to publish container. Response: {response_data}", file=sys.stderr)
+    logger.error(f"Failed to publish container. Response: {response_data}")
     return None
 
-# --- Core Bot Logic Function for Posting ---
-def process_post(post_id_to_post, account_name_to_use):
-    print(f"LOG: Processing post for Post_ID: {post_id_to_post}, Account: {account_name_to_use}")
-    account_name_upper = account_name_to_use.upper()
+def get_threads_container_status(access_token, creation_id):
+    """Returns (status, error_message) for a media container, or (None, None) if the lookup failed."""
+    params = {
+        'fields': 'status,error_message',
+        'access_token': access_token
+    }
+    response_data = make_threads_api_request(creation_id, method='GET', params=params, retries=1)
+    if not response_data:
+        return None, None
+    return response_data.get('status'), response_data.get('error_message')
 
-    threads_user_id = os.getenv(f'THREADS_USER_ID_{account_name_upper}')
-    threads_access_token = os.getenv(f'THREADS_ACCESS_TOKEN_{account_name_upper}')
+def wait_for_container_ready(access_token, creation_id):
+    """Waits until a container can be published, for at most POST_DELAY_SECONDS.
 
-    if not threads_user_id or not threads_access_token:
-        error_note = f"Posting credentials (User ID or Access Token) not found for account '{account_name_to_use}'. Expected env vars: THREADS_USER_ID_{account_name_upper} and THREADS_ACCESS_TOKEN_{account_name_upper}"
-        print(f"ERROR: {error_note}", file=sys.stderr)
-        return {'status': 'failure', 'error_message': error_note}
+    In 'poll' mode the container status is checked with a growing interval and
+    we return as soon as it reports FINISHED. Returns (ready, error_message);
+    ready is False only when Threads reported the container as ERROR or EXPIRED.
+    Hitting the timeout still returns ready=True, matching the old fixed sleep.
+    """
+    if CONTAINER_READINESS_MODE != 'poll':
+        logger.info(f"Waiting {POST_DELAY_SECONDS} seconds before publishing container {creation_id}...")
+        time.sleep(POST_DELAY_SECONDS)
+        return True, None
 
-    sheet = get_google_sheet_client()
-    if not sheet:
-        return {'status': 'failure', 'error_message': 'Failed to connect to Google Sheets.'}
+    deadline = time.monotonic() + POST_DELAY_SECONDS
+    interval = CONTAINER_POLL_INITIAL_SECONDS
+    while True:
+        status, error_message = get_threads_container_status(access_token, creation_id)
+        if status in ('FINISHED', 'PUBLISHED'):
+            logger.info(f"Container {creation_id} is {status}.")
+            return True, None
+        if status in ('ERROR', 'EXPIRED'):
+            logger.error(f"Container {creation_id} is {status}: {error_message}")
+            return False, error_message or f"Container status {status}"
 
-    post_data, row_index = get_post_data(sheet, post_id_to_post)
-    if not post_data or row_index is None:
-        return {'status': 'failure', 'error_message': 'Post data not found, not Ready, or error reading sheet.'}
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logger.warning(f"Container {creation_id} not FINISHED after {POST_DELAY_SECONDS}s (last status: {status}). Publishing anyway.")
+            return True, None
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, CONTAINER_POLL_MAX_SECONDS)
+
+def get_account_credentials(account_name):
+    """Returns (threads_user_id, threads_access_token, error_note) for an account's env vars."""
+    account_name_upper = account_name.upper()
+    threads_user_id = os.getenv(f'THREADS_USER_ID_{account_name_upper}')
+    threads_access_token = os.getenv(f'THREADS_ACCESS_TOKEN_{account_name_upper}')
+    if not threads_user_id or not threads_access_token:
+        error_note = f"Posting credentials (User ID or Access Token) not found for account '{account_name}'. Expected env vars: THREADS_USER_ID_{account_name_upper} and THREADS_ACCESS_TOKEN_{account_name_upper}"
+        return None, None, error_note
+    return threads_user_id, threads_access_token, None
 
-    blocks_content = [
+def get_post_blocks(post_data):
+    return [
         post_data.get('Block_1_Content', ''), post_data.get('Block_2_Content', ''),
         post_data.get('Block_3_Content', ''), post_data.get('Block_4_Content', '')
     ]
 
-    if not any(block.strip() for block in blocks_content):
-        error_note = f"No content found for Post_ID {post_id_to_post} in any block."
-        print(f"ERROR: {error_note}", file=sys.stderr)
-        update_post_status(sheet, row_index, "Error", notes=error_note)
-        return {'status': 'failure', 'error_message': error_note}
-
-    update_post_status(sheet, row_index, "Posting")
-    print(f"LOG: Starting to post Post_ID {post_id_to_post} for account {account_name_to_use}")
+def post_thread_blocks(threads_user_id, threads_access_token, blocks_content, report_progress, post_id=None):
+    """Creates and publishes each non-empty block, each one replying to the previous.
 
+    With a `post_id`, every container and media ID is recorded in the posting
+    ledger and blocks the ledger already shows as published are skipped, so a
+    retry resumes at the first unpublished block and chains from the stored
+    media ID. Returns (root_threads_media_id, error_note). Both are None when
+    every block was empty.
+    """
+    ledger = get_ledger_blocks(post_id) if post_id is not None else {}
+    account = account_for_access_token(threads_access_token)
     root_threads_media_id = None
     previous_block_media_id = None
-    posting_successful = True
 
     for i, block_content_raw in enumerate(blocks_content):
         block_content = block_content_raw.strip()
         block_number = i + 1
         if not block_content:
-            print(f"LOG: Block {block_number} is empty. Skipping.")
+            logger.info(f"Block {block_number} is empty. Skipping.")
+            report_progress(block_number, 'skipped')
             continue
 
-        print(f"LOG: Attempting to post Block {block_number}...")
-        creation_id = create_threads_container(
-            threads_user_id, threads_access_token, block_content,
-            reply_to_id=previous_block_media_id
-        )
+        ledger_entry = ledger.get(block_number, {})
+        if ledger_entry.get('media_id'):
+            published_media_id = ledger_entry['media_id']
+            logger.info(f"Block {block_number} was already published as {published_media_id} (ledger). Resuming after it.")
+            report_progress(block_number, 'published', media_id=published_media_id, resumed=True)
+            if block_number == 1:
+                root_threads_media_id = published_media_id
+            previous_block_media_id = published_media_id
+            continue
+
+        creation_id = ledger_entry.get('container_id')
+        if creation_id:
+            container_status, _ = get_threads_container_status(threads_access_token, creation_id)
+            if container_status == 'PUBLISHED':
+                # Published by an earlier attempt that died before recording the media ID.
+                error_note = f"Block {block_number} container {creation_id} is already published but its media ID was not recorded. Check the thread on Threads before retrying."
+                logger.error(error_note)
+                report_progress(block_number, 'failed', error_message=error_note)
+                return None, error_note
+            if container_status in ('FINISHED', 'IN_PROGRESS'):
+                logger.info(f"Reusing container {creation_id} for Block {block_number} from an earlier attempt.")
+            else:
+                creation_id = None
+
         if not creation_id:
-            error_note = f"Failed to create container for Block {block_number}"
-            print(f"ERROR: {error_note}", file=sys.stderr)
-            update_post_status(sheet, row_index, "Error", notes=error_note)
-            posting_successful = False
-            break
+            logger.info(f"Attempting to post Block {block_number}...")
+            with timed_stage('container_create', account=account) as stage:
+                creation_id = create_threads_container(
+                    threads_user_id, threads_access_token, block_content,
+                    reply_to_id=previous_block_media_id
+                )
+                stage['outcome'] = 'ok' if creation_id else 'error'
+            if not creation_id:
+                error_note = f"Failed to create container for Block {block_number}"
+                logger.error(error_note)
+                report_progress(block_number, 'failed', error_message=error_note)
+                return None, error_note
+            if post_id is not None:
+                record_ledger_block(post_id, block_number, account, container_id=creation_id)
+        report_progress(block_number, 'container_created', container_id=creation_id)
         
-        print(f"LOG: Waiting {POST_DELAY_SECONDS} seconds before publishing Block {block_number}...")
-        time.sleep(POST_DELAY_SECONDS)
+        logger.info(f"Waiting for container of Block {block_number} to be ready (mode: {CONTAINER_READINESS_MODE}, max {POST_DELAY_SECONDS}s)...")
+        with timed_stage('container_wait', account=account) as stage:
+            container_ready, container_error = wait_for_container_ready(threads_access_token, creation_id)
+            stage['outcome'] = 'ok' if container_ready else 'error'
+        if not container_ready:
+            error_note = f"Container for Block {block_number} failed processing: {container_error}"
+            logger.error(error_note)
+            report_progress(block_number, 'failed', error_message=error_note)
+            if post_id is not None:
+                record_ledger_block(post_id, block_number, account, container_id='') # Don't try to reuse it
+            return None, error_note
         
-        published_media_id = publish_threads_container(
-            threads_user_id, threads_access_token, creation_id
-        )
+        with timed_stage('publish', account=account) as stage:
+            published_media_id = publish_threads_container(
+                threads_user_id, threads_access_token, creation_id
+            )
+            stage['outcome'] = 'ok' if published_media_id else 'error'
         if not published_media_id:
             error_note = f"Failed to publish container for Block {block_number}"
-            print(f"ERROR: {error_note}", file=sys.stderr)
-            update_post_status(sheet, row_index, "Error", notes=error_note)
-            posting_successful = False
-            break
+            logger.error(error_note)
+            report_progress(block_number, 'failed', error_message=error_note)
+            return None, error_note
+        if post_id is not None:
+            record_ledger_block(post_id, block_number, account, media_id=published_media_id)
+        report_progress(block_number, 'published', media_id=published_media_id)
             
         if block_number == 1:
             root_threads_media_id = published_media_id
         previous_block_media_id = published_media_id
 
+    return root_threads_media_id, None
+
+def _progress_reporter(progress_callback, post_id, key_prefix='', sheet=None):
+    """Wraps `progress_callback` for post_thread_blocks(). With a `sheet` in 'sheet' claim mode it also renews the row's lease."""
+    def report_progress(block_number, state, **details):
+        if sheet is not None and ROW_CLAIM_MODE == 'sheet':
+            renew_row_claim(sheet, post_id)
+        if progress_callback:
+            try:
+                progress_callback(f"{key_prefix}{block_number}", state, **details)
+            except Exception as e:
+                logger.warning(f"Progress callback failed for Post_ID {post_id}: {e}")
+    return report_progress
+
+# --- Core Bot Logic Function for Posting ---
+def process_post(post_id_to_post, account_name_to_use, progress_callback=None, lane_checked=False):
+    """Posts one Ready_To_Post row as a thread. `progress_callback(block_number, state, **details)` is
+    called as each block moves through create/publish so queued jobs can report progress.
+
+    Holds the Post_ID's in-flight lock for the whole run, so a duplicate request
+    for the same row fails fast instead of posting the thread twice. Unless the
+    job queue already admitted it (`lane_checked`), the post is deferred while
+    the account is at its posting limits or its lane is running a job.
+    """
+    lock_token = acquire_post_lock(post_id_to_post)
+    if lock_token is None:
+        error_note = f"Post_ID {post_id_to_post} is already being posted by another worker."
+        logger.warning(error_note)
+        return {'status': 'failure', 'account_name': account_name_to_use, 'error_message': error_note}
+    try:
+        with timed_stage('process_post', account=account_name_to_use) as stage:
+            result = _process_post_locked(post_id_to_post, account_name_to_use, progress_callback, lane_checked)
+            stage['outcome'] = result.get('status', 'failure')
+        inc_counter('threads_bot_posts_total', 'Posting attempts by account and outcome.', account=account_lane(account_name_to_use), outcome=stage['outcome'])
+        return result
+    finally:
+        release_post_lock(post_id_to_post, lock_token)
+
+def _process_post_locked(post_id_to_post, account_name_to_use, progress_callback, lane_checked=False):
+    prepared, failure = _prepare_post(post_id_to_post, account_name_to_use, lane_checked)
+    if failure:
+        return failure
+    sheet, row_index, blocks_content, threads_user_id, threads_access_token = prepared
+    report_progress = _progress_reporter(progress_callback, post_id_to_post, sheet=sheet)
+    root_threads_media_id, error_note = post_thread_blocks(threads_user_id, threads_access_token, blocks_content, report_progress, post_id=post_id_to_post)
+    return _finish_post(sheet, row_index, post_id_to_post, account_name_to_use, root_threads_media_id, error_note)
+
+def _prepare_post(post_id_to_post, account_name_to_use, lane_checked=False):
+    """Loads a Ready row and marks it Posting, after checking the account's lane unless `lane_checked`.
+
+    Returns ((sheet, row_index, blocks_content, threads_user_id, threads_access_token), None)
+    or (None, failure_result).
+    """
+    logger.info(f"Processing post for Post_ID: {post_id_to_post}, Account: {account_name_to_use}")
+    threads_user_id, threads_access_token, error_note = get_account_credentials(account_name_to_use)
+    if error_note:
+        logger.error(error_note)
+        return None, {'status': 'failure', 'error_message': error_note}
+
+    if not lane_checked:
+        hold = get_account_lane_hold(account_name_to_use)
+        if hold:
+            error_note, wait_seconds = hold
+            logger.warning(f"Deferring Post_ID {post_id_to_post}: {error_note}")
+            return None, {'status': 'deferred', 'account_name': account_name_to_use, 'error_message': error_note, 'retry_after_seconds': round(wait_seconds, 1)}
+
+    with timed_stage('sheets_auth', account=account_name_to_use) as stage:
+        sheet = get_google_sheet_client()
+        stage['outcome'] = 'ok' if sheet else 'error'
+    if not sheet:
+        return None, {'status': 'failure', 'error_message': 'Failed to connect to Google Sheets.'}
+
+    with timed_stage('get_post_data', account=account_name_to_use) as stage:
+        post_data, row_index = get_post_data(sheet, post_id_to_post)
+        stage['outcome'] = 'ok' if post_data else 'not_ready'
+    if not post_data or row_index is None:
+        return None, {'status': 'failure', 'error_message': 'Post data not found, not Ready, or error reading sheet.'}
+
+    blocks_content = get_post_blocks(post_data)
+
+    if not any(block.strip() for block in blocks_content):
+        error_note = f"No content found for Post_ID {post_id_to_post} in any block."
+        logger.error(error_note)
+        update_post_status(sheet, row_index, "Error", notes=error_note, post_id=post_id_to_post)
+        return None, {'status': 'failure', 'error_message': error_note}
+
+    if ROW_CLAIM_MODE == 'sheet':
+        if not claim_ready_rows(sheet, [(str(post_id_to_post).strip(), row_index)]):
+            return None, {'status': 'failure', 'account_name': account_name_to_use, 'error_message': f"Post_ID {post_id_to_post} could not be claimed: another worker holds it or the claim was too slow."}
+    else:
+        update_post_status(sheet, row_index, "Posting", post_id=post_id_to_post)
+    logger.info(f"Starting to post Post_ID {post_id_to_post} for account {account_name_to_use}")
+    return (sheet, row_index, blocks_content, threads_user_id, threads_access_token), None
+
+def _finish_post(sheet, row_index, post_id_to_post, account_name_to_use, root_threads_media_id, error_note):
+    """Writes the final Status (and Posted_Logs row) for a posted row and returns the process_post result."""
+    posting_successful = error_note is None
+    if not posting_successful:
+        write_final_status(sheet, row_index, post_id_to_post, "Error", notes=error_note)
+
     output_data = {'account_name': account_name_to_use}
     if posting_successful and root_threads_media_id:
-        print(f"LOG: Successfully posted thread. Root ID: {root_threads_media_id}")
+        logger.info(f"Successfully posted thread. Root ID: {root_threads_media_id}")
+        try:
+            record_account_post(account_name_to_use)
+        except Exception as e:
+            logger.warning(f"Could not record post against limits for account '{account_name_to_use}': {e}")
         # First, update status in Ready_To_Post (existing logic)
-        update_post_status(sheet, row_index, "Posted", threads_post_id=root_threads_media_id)
+        write_final_status(sheet, row_index, post_id_to_post, "Posted", threads_post_id=root_threads_media_id)
         
         # --- MODIFIED/NEW --- Call to log to "Posted_Logs" sheet
         # Use UTC time for consistency if preferred: datetime.utcnow().isoformat() + "Z"
         timestamp_now_iso = datetime.now().isoformat() 
+        remember_post_timestamp(root_threads_media_id, timestamp_now_iso)
         
         log_success = log_to_posted_sheet(
             sheet=sheet, # Use the same sheet client
@@ -327,7 +1486,7 @@ def process_post(post_id_to_post, account_name_to_use):
             timestamp_posted=timestamp_now_iso
         )
         if not log_success:
-            print(f"WARNING: Failed to log successful post (Original_Post_ID: {post_id_to_post}) to {POSTED_LOGS_WORKSHEET_NAME}", file=sys.stderr)
+            logger.warning(f"Failed to log successful post (Original_Post_ID: {post_id_to_post}) to {POSTED_LOGS_WORKSHEET_NAME}")
             # Consider if this failure should affect the overall status returned to N8N.
             # For now, it just logs a warning and the original success status is maintained.
         # --- END MODIFIED/NEW ---
@@ -336,8 +1495,8 @@ def process_post(post_id_to_post, account_name_to_use):
         output_data['threads_post_id'] = root_threads_media_id
     elif posting_successful and not root_threads_media_id: 
         error_note = "All content blocks were empty. Nothing was posted."
-        print(f"WARNING: {error_note}", file=sys.stderr)
-        update_post_status(sheet, row_index, "Error", notes=error_note) 
+        logger.warning(error_note)
+        write_final_status(sheet, row_index, post_id_to_post, "Error", notes=error_note)
         output_data['status'] = 'failure' 
         output_data['error_message'] = error_note
     else: 
@@ -347,125 +1506,1963 @@ def process_post(post_id_to_post, account_name_to_use):
     return output_data
 
 
-# --- Flask Endpoint for Posting ---
-@app.route('/process_post', methods=['POST'])
-def process_post_endpoint():
-    print("LOG: Received request at /process_post endpoint.")
-    request_data = request.get_json()
-    if not request_data or 'post_id' not in request_data or 'account_name' not in request_data:
-        print("ERROR: Invalid request data for /process_post. Missing post_id or account_name.", file=sys.stderr)
-        return jsonify({'status': 'error', 'message': 'Invalid request data. Requires post_id and account_name.'}), 400
-    
-    post_id = request_data['post_id']
-    account_name = request_data['account_name']
-    
-    print(f"LOG: Calling process_post function with Post_ID: {post_id}, Account: {account_name}")
-    result = process_post(post_id, account_name)
-    print(f"LOG: Returning result for /process_post for Post_ID {post_id}: {result}")
-    return jsonify(result), 200
+# --- Bulk Posting ---
+# Posts many Ready_To_Post rows with a near-constant number of Sheets calls: one
+# get_all_values() to pick the rows, one batch_update() marking them Posting, one
+# batch_update() with every final Status/Threads_Post_ID/Notes and one
+# append_rows() to Posted_Logs. Accounts post in parallel, rows within an
+# account one after another. In ROW_CLAIM_MODE 'sheet' each row is instead
+# claimed and finished on its own as its lane reaches it (see Row Claims).
+def _ready_batch_items(ready_rows, default_account_name):
+    """Returns [{'post_id', 'account_name'}] for every claimable row in [(row_index, row_data)]."""
+    return [
+        {'post_id': str(row_data.get('Post_ID', '')).strip(), 'account_name': row_data.get('Account_Name') or row_data.get('Account') or default_account_name}
+        for _, row_data in ready_rows if str(row_data.get('Post_ID', '')).strip() and is_row_claimable(row_data)
+    ]
 
+def _select_batch_rows(sheet, items, all_ready, default_account_name):
+    """Returns (to_post, results) where to_post is [(post_id, account_name, row_index, post_data)]."""
+    refresh_ready_to_post_snapshot(sheet, force=True)
+    rows_by_post_id = {}
+    for row_index, row_data in get_cached_ready_rows(sheet):
+        row_post_id = str(row_data.get('Post_ID', '')).strip()
+        if row_post_id and row_post_id not in rows_by_post_id:
+            rows_by_post_id[row_post_id] = (row_index, row_data)
 
-# +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
-# | NEW Flask Endpoint for Getting Thread Insights                    |
-# +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
-@app.route('/get_thread_insights', methods=['POST'])
-def get_thread_insights_route():
-    print("LOG: Received request at /get_thread_insights") 
+    if all_ready:
+        items = _ready_batch_items(rows_by_post_id.values(), default_account_name)
+
+    to_post = []
+    results = {}
+    for item in items:
+        post_id = str(item.get('post_id', '')).strip()
+        account_name = item.get('account_name') or default_account_name
+        if post_id in results or any(post_id == queued[0] for queued in to_post):
+            continue # Duplicate request for the same row
+        if not post_id or not account_name:
+            results[post_id or '?'] = {'status': 'failure', 'account_name': account_name, 'error_message': 'Missing post_id or account_name.'}
+            continue
+        if post_id not in rows_by_post_id:
+            results[post_id] = {'status': 'failure', 'account_name': account_name, 'error_message': 'Post data not found, not Ready, or error reading sheet.'}
+            continue
+        row_index, row_data = rows_by_post_id[post_id]
+        if not is_row_claimable(row_data):
+            logger.warning(f"Post_ID '{post_id}' status is '{row_data.get('Status')}', not 'Ready'. Skipping.")
+            results[post_id] = {'status': 'failure', 'account_name': account_name, 'error_message': 'Post data not found, not Ready, or error reading sheet.'}
+            continue
+        to_post.append((post_id, account_name, row_index, row_data))
+    return to_post, results
 
+def process_posts_batch(items=None, account_name=None, all_ready=False, progress_callback=None):
+    """Posts many Ready_To_Post rows, batching every Sheets read and write.
+
+    `items` is [{'post_id', 'account_name'}] (account_name falls back to the
+    `account_name` argument). With all_ready=True every row whose Status is
+    Ready is posted, using its Account_Name/Account column when present.
+    """
+    sheet = get_google_sheet_client()
+    if not sheet:
+        return {'status': 'failure', 'error_message': 'Failed to connect to Google Sheets.'}
     try:
-        n8n_data = request.get_json()
-        if not n8n_data:
-            print("LOG: No JSON data received from N8N for insights")
-            return jsonify({"error": "No JSON data received from N8N"}), 400
-        print(f"LOG: Received data from N8N for insights: {n8n_data}")
+        to_post, results = _select_batch_rows(sheet, items or [], all_ready, account_name)
     except Exception as e:
-        print(f"ERROR: Error getting JSON from insights request: {e}")
-        return jsonify({"error": "Invalid JSON format in insights request"}), 400
+        handle_sheets_error(e)
+        logger.error(f"Could not read {READY_TO_POST_WORKSHEET_NAME} for batch: {e}")
+        return {'status': 'failure', 'error_message': 'Error reading sheet.'}
 
-    threads_post_id = n8n_data.get('threads_post_id')
-    account_name_from_n8n = n8n_data.get('account_name') 
+    start_updates = []
+    lanes = {}
+    for post_id, row_account_name, row_index, post_data in to_post:
+        _, _, error_note = get_account_credentials(row_account_name)
+        if error_note is None and not any(block.strip() for block in get_post_blocks(post_data)):
+            error_note = f"No content found for Post_ID {post_id} in any block."
+            start_updates.append((post_id, row_index, {'Status': 'Error', 'Notes': error_note}))
+        if error_note:
+            logger.error(error_note)
+            results[post_id] = {'status': 'failure', 'account_name': row_account_name, 'error_message': error_note}
+            continue
+        lanes.setdefault(account_lane(row_account_name), []).append((post_id, row_account_name, row_index, post_data))
 
-    if not threads_post_id or not account_name_from_n8n:
-        print("LOG: Missing threads_post_id or account_name in insights request")
-        return jsonify({"error": "Missing 'threads_post_id' or 'account_name' in N8N data for insights"}), 400
+    # Rows past an account's remaining daily budget stay Ready for a later run.
+    for lane, lane_rows in lanes.items():
+        remaining = get_account_posts_remaining(lane)
+        for post_id, row_account_name, _, _ in lane_rows[remaining:]:
+            results[post_id] = {'status': 'deferred', 'account_name': row_account_name, 'error_message': 'Daily post limit reached for account.'}
+        del lane_rows[remaining:]
+        start_updates.extend((post_id, row_index, {'Status': 'Posting'}) for post_id, _, row_index, _ in lane_rows)
+    lanes = {lane: lane_rows for lane, lane_rows in lanes.items() if lane_rows}
 
-    account_name_upper = account_name_from_n8n.upper()
-    insights_token_env_var_name = f"THREADS_ACCESS_TOKEN_{account_name_upper}"
-    access_token = os.getenv(insights_token_env_var_name) 
+    lock_tokens = {}
+    try:
+        return _process_locked_batch(sheet, lanes, start_updates, results, lock_tokens, progress_callback)
+    finally:
+        for post_id, lock_token in lock_tokens.items():
+            release_post_lock(post_id, lock_token)
 
-    print(f"LOG: Attempting to retrieve insights token for '{account_name_from_n8n}' using env var name: '{insights_token_env_var_name}'")
+def _final_batch_values(root_threads_media_id, error_note):
+    """Returns the final Ready_To_Post {header: value} for one batch row."""
+    if root_threads_media_id:
+        return {'Status': 'Posted', 'Threads_Post_ID': str(root_threads_media_id)}
+    return {'Status': 'Error', 'Notes': error_note or "All content blocks were empty. Nothing was posted."}
 
-    if not access_token:
-        print(f"CRITICAL ERROR: Insights Token NOT FOUND for account '{account_name_from_n8n}' using env var '{insights_token_env_var_name}'. Ensure this environment variable is set on Railway and the token has 'threads_manage_insights' permission.")
-        return jsonify({"error": f"Server configuration error: Insights Token for account '{account_name_from_n8n}' not set up. Expected env var: {insights_token_env_var_name}"}), 500
-    else:
-        print(f"LOG: Successfully retrieved insights token (token length: {len(access_token)}).")
+def _process_locked_batch(sheet, lanes, start_updates, results, lock_tokens, progress_callback):
+    # Take every row's in-flight lock before marking it Posting; rows someone else holds are left alone.
+    for lane, lane_rows in list(lanes.items()):
+        for entry in list(lane_rows):
+            post_id, row_account_name, row_index, _ = entry
+            lock_token = acquire_post_lock(post_id)
+            if lock_token is None:
+                lane_rows.remove(entry)
+                start_updates.remove((post_id, row_index, {'Status': 'Posting'}))
+                results[post_id] = {'status': 'skipped', 'account_name': row_account_name, 'error_message': f"Post_ID {post_id} is already being posted by another worker."}
+            else:
+                lock_tokens[post_id] = lock_token
+        if not lane_rows:
+            del lanes[lane]
 
-    metrics_list = "likes,replies,reposts,quotes,shares,views" 
-    insights_api_call_url = f"https://graph.threads.net/v1.0/{threads_post_id}/insights" 
-    
-    api_params = {
-        "metric": metrics_list,
-        "access_token": access_token 
+    if ROW_CLAIM_MODE == 'sheet':
+        # Rows are claimed with a verified lease when their lane reaches them, not up
+        # front, so a lease never runs out while the row waits behind its account's
+        # earlier posts.
+        start_updates = [update for update in start_updates if update[2] != {'Status': 'Posting'}]
+
+    if start_updates and not write_ready_rows(sheet, start_updates):
+        return {'status': 'failure', 'error_message': f"Failed to mark rows as Posting in {READY_TO_POST_WORKSHEET_NAME}."}
+
+    def post_lane(lane_rows):
+        lane_outcomes = []
+        posted_any = False
+        for post_id, row_account_name, row_index, post_data in lane_rows:
+            if posted_any:
+                _, min_interval = get_account_post_limits(row_account_name)
+                if min_interval:
+                    time.sleep(min_interval)
+            if ROW_CLAIM_MODE == 'sheet' and not claim_ready_rows(sheet, [(post_id, row_index)]):
+                results[post_id] = {'status': 'skipped', 'account_name': row_account_name, 'error_message': f"Post_ID {post_id} could not be claimed: another worker holds it or the claim was too slow."}
+                continue
+            posted_any = True
+            threads_user_id, threads_access_token, _ = get_account_credentials(row_account_name)
+            logger.info(f"Starting to post Post_ID {post_id} for account {row_account_name} (batch)")
+            try:
+                root_threads_media_id, error_note = post_thread_blocks(
+                    threads_user_id, threads_access_token, get_post_blocks(post_data),
+                    _progress_reporter(progress_callback, post_id, key_prefix=f"{post_id}/", sheet=sheet),
+                    post_id=post_id
+                )
+            except Exception as e:
+                logger.exception(f"Unhandled exception posting Post_ID {post_id}: {e}")
+                root_threads_media_id, error_note = None, f"Unhandled error: {e}"
+            if root_threads_media_id:
+                try:
+                    record_account_post(row_account_name)
+                except Exception as e:
+                    logger.warning(f"Could not record post against limits for account '{row_account_name}': {e}")
+            if ROW_CLAIM_MODE == 'sheet':
+                release_row_claim(sheet, post_id, row_index, _final_batch_values(root_threads_media_id, error_note))
+            lane_outcomes.append((post_id, row_account_name, row_index, root_threads_media_id, error_note, datetime.now().isoformat()))
+        return lane_outcomes
+
+    outcomes = []
+    if lanes:
+        with ThreadPoolExecutor(max_workers=min(len(lanes), JOB_WORKER_COUNT), thread_name_prefix='batch-lane') as executor:
+            for lane_outcomes in executor.map(post_lane, lanes.values()):
+                outcomes.extend(lane_outcomes)
+
+    final_updates = []
+    log_rows = []
+    for post_id, row_account_name, row_index, root_threads_media_id, error_note, timestamp_posted in outcomes:
+        if ROW_CLAIM_MODE != 'sheet': # Sheet-claimed rows were finished as they were posted
+            final_updates.append((post_id, row_index, _final_batch_values(root_threads_media_id, error_note)))
+        if root_threads_media_id:
+            log_rows.append(build_posted_log_row(post_id, root_threads_media_id, row_account_name, timestamp_posted))
+            remember_post_timestamp(root_threads_media_id, timestamp_posted)
+            results[post_id] = {'status': 'success', 'account_name': row_account_name, 'threads_post_id': root_threads_media_id}
+        else:
+            error_note = error_note or "All content blocks were empty. Nothing was posted."
+            results[post_id] = {'status': 'failure', 'account_name': row_account_name, 'error_message': error_note}
+
+    if final_updates and not write_ready_rows(sheet, final_updates):
+        logger.error(f"Failed to write final statuses for {len(final_updates)} batch rows.")
+    if not write_posted_logs(sheet, log_rows):
+        logger.warning(f"Failed to log {len(log_rows)} successful batch posts to {POSTED_LOGS_WORKSHEET_NAME}")
+
+    succeeded = sum(1 for r in results.values() if r['status'] == 'success')
+    logger.info(f"Batch finished: {succeeded}/{len(results)} posted.")
+    return {
+        'status': 'success' if succeeded == len(results) else 'failure',
+        'posted': succeeded,
+        'failed': sum(1 for r in results.values() if r['status'] == 'failure'),
+        'deferred': sum(1 for r in results.values() if r['status'] == 'deferred'),
+        'skipped': sum(1 for r in results.values() if r['status'] == 'skipped'),
+        'results': results,
     }
-    
-    print(f"LOG: Calling Threads Insights API: GET {insights_api_call_url} for account {account_name_from_n8n}")
 
-    try:
-        response = requests.get(insights_api_call_url, params=api_params, timeout=30) 
-        
-        print(f"LOG: Threads Insights API Response Status Code: {response.status_code}")
-        print(f"LOG: Threads Insights API Response Content (first 500 chars): {response.text[:500]}...")
+def enqueue_batch_jobs(items=None, account_name=None, all_ready=False):
+    """Queues a batch as one job per account lane, so each account still posts one job at a time.
+
+    With all_ready=True the Ready rows are read from the cached snapshot and
+    grouped by their Account_Name/Account column. Returns [(account_name, job_id)].
+    """
+    if all_ready:
+        sheet = get_google_sheet_client()
+        if not sheet:
+            raise RuntimeError('Failed to connect to Google Sheets.')
+        items = _ready_batch_items(get_cached_ready_rows(sheet), account_name)
+    groups = {}
+    for item in items or []:
+        item_account_name = item.get('account_name') or account_name or '*'
+        group_account_name, group_items = groups.setdefault(account_lane(item_account_name), (item_account_name, []))
+        group_items.append(item)
+    jobs = []
+    for group_account_name, group_items in groups.values():
+        payload = {'items': group_items, 'account_name': account_name, 'all_ready': False}
+        jobs.append((group_account_name, enqueue_job(f"{len(group_items)} posts", group_account_name, kind='batch', payload=payload)))
+    return jobs
+
+
+# --- Posting Ledger ---
+# Per-Post_ID record (in JOBS_DB_PATH) of each block's container and published
+# media ID, plus an in-flight lock per Post_ID. post_thread_blocks() uses it to
+# resume a partially posted thread instead of posting earlier blocks again, and
+# the lock stops two workers or replicas sharing the database from posting the
+# same row at once. A finished thread stays in the ledger, so re-running its row
+# only re-applies the Posted status; DELETE /ledger/<post_id> to post it afresh.
+def get_ledger_blocks(post_id):
+    """Returns {block_number: {'container_id', 'media_id'}} recorded for `post_id`."""
+    conn = _jobs_connect()
+    try:
+        rows = conn.execute('SELECT block_number, container_id, media_id FROM post_blocks WHERE post_id = ?', (str(post_id),)).fetchall()
+    finally:
+        conn.close()
+    return {r['block_number']: {'container_id': r['container_id'], 'media_id': r['media_id']} for r in rows}
+
+def record_ledger_block(post_id, block_number, account, container_id=None, media_id=None):
+    """Upserts one block's container and/or media ID. None leaves a stored value untouched."""
+    conn = _jobs_connect()
+    try:
+        conn.execute(
+            """INSERT INTO post_blocks (post_id, block_number, account, container_id, media_id, updated_at) VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT (post_id, block_number) DO UPDATE SET
+                   account = excluded.account,
+                   container_id = COALESCE(excluded.container_id, container_id),
+                   media_id = COALESCE(excluded.media_id, media_id),
+                   updated_at = excluded.updated_at""",
+            (str(post_id), block_number, account, container_id, media_id, datetime.now().isoformat())
+        )
+    finally:
+        conn.close()
+
+def clear_ledger(post_id):
+    """Forgets every recorded block of `post_id`. Returns how many were removed."""
+    conn = _jobs_connect()
+    try:
+        return conn.execute('DELETE FROM post_blocks WHERE post_id = ?', (str(post_id),)).rowcount
+    finally:
+        conn.close()
+
+def acquire_post_lock(post_id, ttl_seconds=None):
+    """Takes the in-flight lock for `post_id`. Returns a release token, or None if another live worker holds it."""
+    ttl_seconds = POST_LOCK_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+    token = uuid.uuid4().hex
+    owner = f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+    now = time.time()
+    conn = _jobs_connect()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        held = conn.execute('SELECT owner, expires_ts FROM post_locks WHERE post_id = ?', (str(post_id),)).fetchone()
+        if held is not None and held['expires_ts'] > now:
+            conn.execute('COMMIT')
+            logger.info(f"Post_ID {post_id} is locked by {held['owner']}.")
+            return None
+        if held is not None:
+            logger.warning(f"Taking over expired lock on Post_ID {post_id} from {held['owner']}.")
+        conn.execute(
+            'INSERT OR REPLACE INTO post_locks (post_id, owner, token, expires_ts) VALUES (?, ?, ?, ?)',
+            (str(post_id), owner, token, now + ttl_seconds)
+        )
+        conn.execute('COMMIT')
+        return token
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+def release_post_lock(post_id, token):
+    """Releases the lock if `token` still owns it."""
+    conn = _jobs_connect()
+    try:
+        conn.execute('DELETE FROM post_locks WHERE post_id = ? AND token = ?', (str(post_id), token))
+    finally:
+        conn.close()
+
+# --- Row Claims ---
+# How a replica takes ownership of a Ready_To_Post row before posting it. In
+# ROW_CLAIM_MODE 'local' the SQLite in-flight lock above is the only guard, which
+# covers replicas sharing JOBS_DB_PATH. In 'sheet' mode the claim lives in the
+# row itself so replicas on different hosts can split the queue: Status is set
+# to Posting together with a lease (CLAIM_OWNER_COLUMN = "<WORKER_ID>/<token>",
+# CLAIM_EXPIRES_COLUMN = expiry time). Sheets has no compare-and-set, so the
+# claim is last-writer-wins and verified: each contender re-reads the row,
+# writes its lease, waits CLAIM_SETTLE_SECONDS and only proceeds if its own
+# lease is still there. A contender whose read-to-write gap exceeded the settle
+# time gives up, so a late overwrite can't let two replicas through. A Posting
+# row whose lease has expired belongs to a crashed worker and can be claimed
+# again; it resumes from the posting ledger only if the replicas share
+# JOBS_DB_PATH, otherwise it is posted from its first block. A held lease is
+# renewed as the post moves from block to block once half of it has run out,
+# and the final Status is written together with the lease clear straight to
+# Sheets, never through the write-behind buffer, so the row is never left
+# Posting with a lapsed lease while its thread is already up.
+_row_claims_lock = threading.Lock()
+_row_claims = {} # post_id -> {'row_index', 'owner', 'expires_ts'} for leases this process holds
+
+def _row_claim_state(row_data, now=None):
+    """Returns 'free', 'held' or 'expired' for a row's lease columns."""
+    owner = str(row_data.get(CLAIM_OWNER_COLUMN, '')).strip()
+    if not owner:
+        return 'free'
+    try:
+        expires_ts = _parse_post_timestamp(row_data.get(CLAIM_EXPIRES_COLUMN, '')).timestamp()
+    except ValueError:
+        return 'expired' # Unreadable expiry: don't let it block the row forever
+    return 'held' if expires_ts > (now or time.time()) else 'expired'
+
+def is_row_claimable(row_data, now=None):
+    """True if a row may be posted: Ready without a live lease, or (sheet mode) Posting with an expired lease."""
+    status = row_data.get('Status')
+    if ROW_CLAIM_MODE != 'sheet':
+        return status == 'Ready'
+    claim_state = _row_claim_state(row_data, now)
+    if status == 'Ready':
+        return claim_state != 'held'
+    return status == 'Posting' and claim_state == 'expired'
+
+def _read_claim_rows(sheet, post_rows):
+    """Re-reads the given rows from Sheets. Returns {post_id: row_data} for rows still holding their Post_ID."""
+    worksheet = get_worksheet(sheet, READY_TO_POST_WORKSHEET_NAME)
+    if len(post_rows) == 1:
+        post_id, row_index = post_rows[0]
+        rows = {row_index: sheets_call('read', worksheet.row_values, row_index)}
+    else:
+        refresh_ready_to_post_snapshot(sheet, force=True)
+        with _ready_lock:
+            rows = {row_index: list(_ready_cache['rows'].get(row_index, [])) for _, row_index in post_rows}
+    headers = get_ready_to_post_headers(sheet)
+    found = {}
+    for post_id, row_index in post_rows:
+        row_data = dict(zip(headers, rows[row_index]))
+        if str(row_data.get('Post_ID', '')).strip() == str(post_id).strip():
+            found[post_id] = row_data
+    return found
+
+def claim_ready_rows(sheet, post_rows):
+    """Claims [(post_id, row_index)] with a verified sheet lease. Returns {post_id: row_index} for the rows won."""
+    columns = get_ready_to_post_columns(sheet)
+    missing = [name for name in ('Status', CLAIM_OWNER_COLUMN, CLAIM_EXPIRES_COLUMN) if name not in columns]
+    if missing:
+        logger.error(f"ROW_CLAIM_MODE=sheet needs columns {missing} in {READY_TO_POST_WORKSHEET_NAME}. Not claiming {len(post_rows)} rows.")
+        return {}
+    # The read and write quota is taken before the clock starts, so only the two
+    # Sheets round trips count against CLAIM_SETTLE_SECONDS.
+    with prepaid_sheets_calls(read=1, write=1):
+        read_started = time.monotonic()
+        current = _read_claim_rows(sheet, post_rows)
+        candidates = [(post_id, row_index) for post_id, row_index in post_rows if post_id in current and is_row_claimable(current[post_id])]
+        for post_id, row_index in post_rows:
+            if (post_id, row_index) not in candidates:
+                logger.info(f"Post_ID {post_id} is no longer claimable (status '{current.get(post_id, {}).get('Status')}').")
+        if not candidates:
+            return {}
+
+        expires_ts = time.time() + POST_LOCK_TTL_SECONDS
+        expires_at = datetime.fromtimestamp(expires_ts).astimezone().isoformat(timespec='seconds')
+        owners = {post_id: f"{WORKER_ID}/{uuid.uuid4().hex[:12]}" for post_id, _ in candidates}
+        updates = [(row_index, {'Status': 'Posting', CLAIM_OWNER_COLUMN: owners[post_id], CLAIM_EXPIRES_COLUMN: expires_at}) for post_id, row_index in candidates]
+        if not update_ready_rows(sheet, updates):
+            return {}
+        write_gap = time.monotonic() - read_started
+    if write_gap > CLAIM_SETTLE_SECONDS:
+        # Someone may have verified their own claim before our write landed, so we
+        # back off. Rows still carrying our lease get their previous Status and
+        # lease back rather than staying Posting until the lease expires.
+        logger.warning(f"Claim write for {len(candidates)} rows took {write_gap:.1f}s (> CLAIM_SETTLE_SECONDS). Releasing them.")
+        inc_counter('threads_bot_row_claims_total', 'Sheet row claims by outcome.', len(candidates), outcome='slow')
+        reread = _read_claim_rows(sheet, candidates)
+        restores = [
+            (row_index, {name: current[post_id].get(name, '') for name in ('Status', CLAIM_OWNER_COLUMN, CLAIM_EXPIRES_COLUMN)})
+            for post_id, row_index in candidates
+            if str(reread.get(post_id, {}).get(CLAIM_OWNER_COLUMN, '')).strip() == owners[post_id]
+        ]
+        if restores and not update_ready_rows(sheet, restores):
+            logger.error(f"Could not release {len(restores)} slow claims; they stay Posting until the lease expires.")
+        return {}
+
+    time.sleep(CLAIM_SETTLE_SECONDS)
+    verified = _read_claim_rows(sheet, candidates)
+    won = {}
+    for post_id, row_index in candidates:
+        owner = str(verified.get(post_id, {}).get(CLAIM_OWNER_COLUMN, '')).strip()
+        if owner == owners[post_id]:
+            won[post_id] = row_index
+        else:
+            logger.info(f"Lost claim on Post_ID {post_id} to {owner or 'a moved row'}.")
+    with _row_claims_lock:
+        for post_id, row_index in won.items():
+            _row_claims[post_id] = {'row_index': row_index, 'owner': owners[post_id], 'expires_ts': expires_ts}
+    inc_counter('threads_bot_row_claims_total', 'Sheet row claims by outcome.', len(won), outcome='won')
+    inc_counter('threads_bot_row_claims_total', 'Sheet row claims by outcome.', len(candidates) - len(won), outcome='lost')
+    return won
+
+def _locate_claimed_row(sheet, post_id, row_index):
+    """Returns (row_index, row_data) for `post_id`, re-reading the sheet if the row moved, or (None, None)."""
+    current = _read_claim_rows(sheet, [(post_id, row_index)])
+    if post_id in current:
+        return row_index, current[post_id]
+    row_index = find_post_row(sheet, post_id, force_refresh=True)
+    if row_index is None:
+        return None, None
+    return row_index, _read_claim_rows(sheet, [(post_id, row_index)]).get(post_id)
+
+def renew_row_claim(sheet, post_id):
+    """Extends this process's lease on `post_id` once half of it has run out. Returns False if the lease was lost."""
+    post_id = str(post_id).strip()
+    with _row_claims_lock:
+        claim = dict(_row_claims.get(post_id) or {})
+    if not claim or claim['expires_ts'] - time.time() > POST_LOCK_TTL_SECONDS / 2:
+        return True
+    try:
+        row_index, row_data = _locate_claimed_row(sheet, post_id, claim['row_index'])
+        owner = str((row_data or {}).get(CLAIM_OWNER_COLUMN, '')).strip()
+        if owner != claim['owner']:
+            logger.error(f"Lease on Post_ID {post_id} was lost to {owner or 'a deleted row'} while posting.")
+            inc_counter('threads_bot_row_claims_total', 'Sheet row claims by outcome.', outcome='lease_lost')
+            return False
+        expires_ts = time.time() + POST_LOCK_TTL_SECONDS
+        expires_at = datetime.fromtimestamp(expires_ts).astimezone().isoformat(timespec='seconds')
+        if not update_ready_rows(sheet, [(row_index, {CLAIM_EXPIRES_COLUMN: expires_at})]):
+            return True # Still ours until the old expiry; the next block tries again
+    except Exception as e:
+        handle_sheets_error(e)
+        logger.warning(f"Could not renew lease on Post_ID {post_id}: {e}")
+        return True
+    with _row_claims_lock:
+        if post_id in _row_claims:
+            _row_claims[post_id].update(row_index=row_index, expires_ts=expires_ts)
+    inc_counter('threads_bot_row_claims_total', 'Sheet row claims by outcome.', outcome='renewed')
+    return True
+
+def release_row_claim(sheet, post_id, row_index, values):
+    """Writes a claimed row's final {header: value} and clears its lease straight to Sheets.
+
+    Falls back to the write-behind buffer if the direct write fails, so the
+    status is still retried.
+    """
+    post_id = str(post_id).strip()
+    with _row_claims_lock:
+        claim = _row_claims.pop(post_id, None)
+    values = dict(values, **{CLAIM_OWNER_COLUMN: '', CLAIM_EXPIRES_COLUMN: ''})
+    try:
+        found_row_index, _ = _locate_claimed_row(sheet, post_id, claim['row_index'] if claim else row_index)
+        if found_row_index is None:
+            logger.error(f"Post_ID {post_id} is no longer in {READY_TO_POST_WORKSHEET_NAME}. Final status {values.get('Status')!r} not written.")
+            return False
+        if update_ready_rows(sheet, [(found_row_index, values)]):
+            return True
+        row_index = found_row_index
+    except Exception as e:
+        handle_sheets_error(e)
+        logger.warning(f"Could not write final status for Post_ID {post_id} directly: {e}")
+    logger.warning(f"Buffering final status for Post_ID {post_id} after a failed direct write.")
+    return write_ready_rows(sheet, [(post_id, row_index, values)])
+
+def write_final_status(sheet, row_index, post_id, status, threads_post_id=None, notes=None):
+    """update_post_status() for a row's terminal Status; in 'sheet' mode it also clears the lease, unbuffered."""
+    if ROW_CLAIM_MODE != 'sheet':
+        update_post_status(sheet, row_index, status, threads_post_id=threads_post_id, notes=notes, post_id=post_id)
+        return
+    values = {'Status': status}
+    if threads_post_id:
+        values['Threads_Post_ID'] = str(threads_post_id)
+    if notes:
+        values['Notes'] = notes
+    release_row_claim(sheet, post_id, row_index, values)
+
+# --- Durable Job Queue ---
+# /process_post enqueues into a local SQLite database and returns right away; a
+# pool of background threads claims and runs the jobs. Every progress update
+# bumps `updated_ts`, so a job left 'running' by a crashed or redeployed
+# process is picked up again once it has been idle for JOB_STALE_SECONDS.
+_jobs_init_lock = threading.Lock()
+_jobs_wakeup = threading.Condition()
+_job_workers = []
+
+_jobs_schema_lock = threading.Lock()
+_jobs_schema_ready = False
+
+def _jobs_connect():
+    conn = sqlite3.connect(JOBS_DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    if not _jobs_schema_ready:
+        init_job_store(conn)
+    return conn
+
+def init_job_store(conn):
+    """Creates the jobs, account_posts and posting ledger tables if they do not exist yet."""
+    global _jobs_schema_ready
+    with _jobs_schema_lock:
+        if _jobs_schema_ready:
+            return
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                post_id TEXT NOT NULL,
+                account_name TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                progress TEXT NOT NULL DEFAULT '{}',
+                result TEXT,
+                created_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT,
+                updated_ts REAL NOT NULL,
+                kind TEXT NOT NULL DEFAULT 'post',
+                payload TEXT
+            )
+        """)
+        existing_columns = {r[1] for r in conn.execute('PRAGMA table_info(jobs)')}
+        for column, definition in (('kind', "TEXT NOT NULL DEFAULT 'post'"), ('payload', 'TEXT')):
+            if column not in existing_columns: # Databases created before the column existed
+                conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} {definition}')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_status_idx ON jobs (status, created_at)')
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS account_posts (
+                lane TEXT NOT NULL,
+                posted_ts REAL NOT NULL
+            )
+        """)
+        conn.execute('CREATE INDEX IF NOT EXISTS account_posts_lane_idx ON account_posts (lane, posted_ts)')
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS post_blocks (
+                post_id TEXT NOT NULL,
+                block_number INTEGER NOT NULL,
+                account TEXT,
+                container_id TEXT,
+                media_id TEXT,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (post_id, block_number)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS post_locks (
+                post_id TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                token TEXT NOT NULL,
+                expires_ts REAL NOT NULL
+            )
+        """)
+        _jobs_schema_ready = True
+
+def enqueue_job(post_id, account_name, kind='post', payload=None):
+    """Persists a new job and wakes a worker. Returns the job ID.
+
+    kind='post' runs process_post(post_id, account_name); kind='batch' runs
+    process_posts_batch(**payload) in the `account_name` lane.
+    """
+    ensure_job_workers_started()
+    job_id = uuid.uuid4().hex
+    conn = _jobs_connect()
+    try:
+        conn.execute(
+            "INSERT INTO jobs (id, post_id, account_name, status, created_at, updated_ts, kind, payload) VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+            (job_id, str(post_id), account_name, datetime.now().isoformat(), time.time(), kind, json.dumps(payload) if payload is not None else None)
+        )
+    finally:
+        conn.close()
+    with _jobs_wakeup:
+        _jobs_wakeup.notify()
+    _wake_async_dispatcher()
+    logger.info(f"Queued job {job_id} for Post_ID: {post_id}, Account: {account_name}")
+    return job_id
+
+def claim_next_job():
+    """Atomically moves the next runnable job to 'running' and returns it.
+
+    Orphaned running jobs are re-claimed first. Otherwise the oldest queued job
+    is taken from the first account lane that is idle and within its posting
+    limits, so each account posts one job at a time while accounts run in parallel.
+    """
+    conn = _jobs_connect()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        now = time.time()
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE status = 'running' AND updated_ts < ? ORDER BY created_at LIMIT 1",
+            (now - JOB_STALE_SECONDS,)
+        ).fetchone()
+        if row is not None and row['attempts'] >= JOB_MAX_ATTEMPTS:
+            logger.error(f"Job {row['id']} was orphaned {row['attempts']} times. Marking it failed.")
+            result = {'status': 'failure', 'account_name': row['account_name'], 'error_message': 'Job was interrupted too many times.'}
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', result = ?, finished_at = ?, updated_ts = ? WHERE id = ?",
+                (json.dumps(result), datetime.now().isoformat(), now, row['id'])
+            )
+            conn.execute('COMMIT')
+            return claim_next_job()
+        if row is not None:
+            logger.warning(f"Job {row['id']} was left running by a previous worker. Re-claiming it.")
+        else:
+            row = _next_job_from_open_lane(conn, now)
+        if row is None:
+            conn.execute('COMMIT')
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, updated_ts = ? WHERE id = ?",
+            (datetime.now().isoformat(), now, row['id'])
+        )
+        conn.execute('COMMIT')
+        return dict(row)
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+# --- Per-Account Posting Lanes ---
+# Each THREADS_USER_ID_<NAME> / THREADS_ACCESS_TOKEN_<NAME> pair is a lane keyed
+# by the upper-cased account name. A lane runs at most one job at a time (across
+# every process sharing JOBS_DB_PATH) and is held back while the account is at
+# its daily post limit or inside its minimum post interval.
+def account_lane(account_name):
+    return str(account_name).upper()
+
+def get_account_post_limits(account_name):
+    """Returns (daily_post_limit, min_post_interval_seconds), honouring per-account env overrides."""
+    lane = account_lane(account_name)
+    daily_limit = int(os.getenv(f'THREADS_DAILY_POST_LIMIT_{lane}', THREADS_DAILY_POST_LIMIT))
+    min_interval = int(os.getenv(f'THREADS_MIN_POST_INTERVAL_SECONDS_{lane}', THREADS_MIN_POST_INTERVAL_SECONDS))
+    return daily_limit, min_interval
+
+def _account_lane_wait_seconds(conn, lane, now):
+    """Seconds until `lane` may start another post (0 when it is free right now)."""
+    daily_limit, min_interval = get_account_post_limits(lane)
+    window_start = now - 86400
+    count, last_posted_ts, oldest_ts = conn.execute(
+        'SELECT COUNT(*), MAX(posted_ts), MIN(posted_ts) FROM account_posts WHERE lane = ? AND posted_ts > ?',
+        (lane, window_start)
+    ).fetchone()
+    wait = 0
+    if count >= daily_limit:
+        wait = oldest_ts - window_start
+    if min_interval and last_posted_ts is not None:
+        wait = max(wait, last_posted_ts + min_interval - now)
+    return max(wait, 0)
+
+def _next_job_from_open_lane(conn, now):
+    busy_lanes = {
+        r[0] for r in conn.execute(
+            "SELECT DISTINCT UPPER(account_name) FROM jobs WHERE status = 'running' AND updated_ts >= ?",
+            (now - JOB_STALE_SECONDS,)
+        )
+    }
+    queued_lanes = conn.execute(
+        "SELECT UPPER(account_name) AS lane, MIN(created_at) AS oldest FROM jobs WHERE status = 'queued' GROUP BY lane ORDER BY oldest"
+    ).fetchall()
+    for lane_row in queued_lanes:
+        lane = lane_row['lane']
+        if lane in busy_lanes or _account_lane_wait_seconds(conn, lane, now) > 0:
+            continue
+        return conn.execute(
+            "SELECT * FROM jobs WHERE status = 'queued' AND UPPER(account_name) = ? ORDER BY created_at LIMIT 1",
+            (lane,)
+        ).fetchone()
+    return None
+
+def get_account_lane_hold(account_name):
+    """Returns (reason, wait_seconds) if a post for `account_name` must not start outside the job queue now, else None."""
+    lane = account_lane(account_name)
+    now = time.time()
+    conn = _jobs_connect()
+    try:
+        running = conn.execute(
+            "SELECT MIN(updated_ts) FROM jobs WHERE status = 'running' AND UPPER(account_name) = ? AND updated_ts >= ?",
+            (lane, now - JOB_STALE_SECONDS)
+        ).fetchone()[0]
+        if running is not None:
+            return f"Account lane {lane} is running a queued job.", JOB_POLL_SECONDS
+        wait = _account_lane_wait_seconds(conn, lane, now)
+        if wait <= 0:
+            return None
+        daily_limit, _ = get_account_post_limits(lane)
+        posted = conn.execute('SELECT COUNT(*) FROM account_posts WHERE lane = ? AND posted_ts > ?', (lane, now - 86400)).fetchone()[0]
+    finally:
+        conn.close()
+    if posted >= daily_limit:
+        return 'Daily post limit reached for account.', wait
+    return 'Minimum post interval for account has not passed yet.', wait
+
+def get_account_posts_remaining(account_name):
+    """Returns how many more threads the account may publish in the current 24h window."""
+    lane = account_lane(account_name)
+    daily_limit, _ = get_account_post_limits(lane)
+    conn = _jobs_connect()
+    try:
+        posted = conn.execute('SELECT COUNT(*) FROM account_posts WHERE lane = ? AND posted_ts > ?', (lane, time.time() - 86400)).fetchone()[0]
+    finally:
+        conn.close()
+    return max(daily_limit - posted, 0)
+
+def record_account_post(account_name):
+    """Counts a published thread against the account's posting limits."""
+    now = time.time()
+    conn = _jobs_connect()
+    try:
+        conn.execute('INSERT INTO account_posts (lane, posted_ts) VALUES (?, ?)', (account_lane(account_name), now))
+        conn.execute('DELETE FROM account_posts WHERE posted_ts <= ?', (now - 86400,))
+    finally:
+        conn.close()
+
+def get_account_lane_status():
+    """Returns per-lane queue depth, running state and remaining daily posts for reporting."""
+    now = time.time()
+    conn = _jobs_connect()
+    try:
+        lanes = {}
+        for r in conn.execute("SELECT UPPER(account_name) AS lane, status, COUNT(*) AS n FROM jobs WHERE status IN ('queued', 'running') GROUP BY lane, status"):
+            lanes.setdefault(r['lane'], {'queued': 0, 'running': 0})[r['status']] = r['n']
+        for lane, info in lanes.items():
+            daily_limit, _ = get_account_post_limits(lane)
+            posted = conn.execute('SELECT COUNT(*) FROM account_posts WHERE lane = ? AND posted_ts > ?', (lane, now - 86400)).fetchone()[0]
+            info['posts_remaining_24h'] = max(daily_limit - posted, 0)
+            info['wait_seconds'] = round(_account_lane_wait_seconds(conn, lane, now), 1)
+        return lanes
+    finally:
+        conn.close()
+
+def update_job_progress(job_id, block_number, state, **details):
+    """Records the latest state of one block of a running job."""
+    conn = _jobs_connect()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute('SELECT progress FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        progress = json.loads(row['progress']) if row else {}
+        block = progress.setdefault('blocks', {}).setdefault(str(block_number), {})
+        block['state'] = state
+        block.update(details)
+        block['updated_at'] = datetime.now().isoformat()
+        conn.execute('UPDATE jobs SET progress = ?, updated_ts = ? WHERE id = ?', (json.dumps(progress), time.time(), job_id))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+def finish_job(job_id, result):
+    """Stores the process_post result and marks the job succeeded or failed."""
+    status = 'succeeded' if result.get('status') == 'success' else 'failed'
+    conn = _jobs_connect()
+    try:
+        conn.execute(
+            'UPDATE jobs SET status = ?, result = ?, finished_at = ?, updated_ts = ? WHERE id = ?',
+            (status, json.dumps(result), datetime.now().isoformat(), time.time(), job_id)
+        )
+    finally:
+        conn.close()
+
+def get_job(job_id):
+    """Returns a job as a JSON-ready dict, or None if the ID is unknown."""
+    conn = _jobs_connect()
+    try:
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    job = dict(row)
+    job['progress'] = json.loads(job['progress'])
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    job['payload'] = json.loads(job['payload']) if job['payload'] else None
+    del job['updated_ts']
+    return job
+
+def has_open_job(post_id):
+    """True if a 'post' job for `post_id` is queued or running."""
+    conn = _jobs_connect()
+    try:
+        row = conn.execute(
+            "SELECT 1 FROM jobs WHERE post_id = ? AND kind = 'post' AND status IN ('queued', 'running') LIMIT 1",
+            (str(post_id),)
+        ).fetchone()
+    finally:
+        conn.close()
+    return row is not None
+
+def _job_progress_callback(job_id):
+    return lambda block_number, state, **details: update_job_progress(job_id, block_number, state, **details)
+
+def _job_failure_result(job, e):
+    logger.exception(f"Unhandled exception in job {job['id']}: {e}")
+    return {'status': 'failure', 'account_name': job['account_name'], 'error_message': f"Unhandled error: {e}"}
+
+def _record_job_result(job, result):
+    finish_job(job['id'], result)
+    inc_counter('threads_bot_jobs_total', 'Finished background jobs by kind and outcome.', kind=job.get('kind') or 'post', outcome=result.get('status', 'failure'))
+    logger.info(f"Job {job['id']} finished with status '{result.get('status')}'.")
+
+def run_job(job):
+    job_id = job['id']
+    logger.info(f"Worker {threading.current_thread().name} running job {job_id} (attempt {job['attempts'] + 1})")
+    try:
+        progress_callback = _job_progress_callback(job_id)
+        if job.get('kind') == 'batch':
+            result = process_posts_batch(progress_callback=progress_callback, **json.loads(job['payload']))
+        else:
+            result = process_post(job['post_id'], job['account_name'], progress_callback=progress_callback, lane_checked=True)
+    except Exception as e:
+        result = _job_failure_result(job, e)
+    _record_job_result(job, result)
+
+def _job_worker_loop():
+    while True:
+        try:
+            job = claim_next_job()
+        except Exception as e:
+            logger.error(f"Could not claim job from {JOBS_DB_PATH}: {e}")
+            job = None
+        if job is None:
+            with _jobs_wakeup:
+                _jobs_wakeup.wait(timeout=JOB_POLL_SECONDS)
+            continue
+        run_job(job)
+
+def ensure_job_workers_started():
+    """Starts the background worker pool (or the asyncio job dispatcher) once per process."""
+    with _jobs_init_lock:
+        if _job_workers:
+            return
+        if POSTING_ENGINE == 'asyncio':
+            loop = ensure_async_engine_started()
+            _job_workers.append(asyncio.run_coroutine_threadsafe(_async_job_dispatcher(), loop))
+            logger.info(f"Started asyncio job dispatcher using {JOBS_DB_PATH} (max {ASYNC_MAX_IN_FLIGHT_POSTS} posts in flight)")
+            return
+        for i in range(JOB_WORKER_COUNT):
+            worker = threading.Thread(target=_job_worker_loop, name=f"job-worker-{i + 1}", daemon=True)
+            worker.start()
+            _job_workers.append(worker)
+        logger.info(f"Started {JOB_WORKER_COUNT} job workers using {JOBS_DB_PATH}")
+
+
+# --- Async Posting Engine ---
+# With POSTING_ENGINE=asyncio, posts run as coroutines on one event loop in a
+# background thread instead of holding a worker thread each. Threads API calls
+# share one aiohttp session and container waits are awaited, so a post that is
+# waiting costs a coroutine, not an OS thread. Sheets and SQLite work (row
+# lookup, status writes, ledger, locks) is still blocking and runs on two sized
+# executors: SQLite and ledger calls on the loop's default executor
+# (ASYNC_BLOCKING_THREADS, via asyncio.to_thread) and the Sheets steps on their
+# own (ASYNC_SHEETS_THREADS), so posts sleeping on the Sheets quota or a claim
+# settle can't use up the threads every block needs for its ledger writes.
+_async_engine_lock = threading.Lock()
+_async_engine = {
+    'loop': None,
+    'sheets_executor': None, # ThreadPoolExecutor(ASYNC_SHEETS_THREADS)
+    'session': None,
+    'slots': None, # asyncio.Semaphore(ASYNC_MAX_IN_FLIGHT_POSTS)
+    'wakeup': None, # asyncio.Event set by enqueue_job
+    'tasks': set(),
+}
+
+async def _open_async_engine():
+    _async_engine['slots'] = asyncio.Semaphore(ASYNC_MAX_IN_FLIGHT_POSTS)
+    _async_engine['wakeup'] = asyncio.Event()
+    _async_engine['session'] = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=ASYNC_HTTP_CONNECTION_LIMIT),
+        timeout=aiohttp.ClientTimeout(sock_connect=HTTP_CONNECT_TIMEOUT_SECONDS, sock_read=HTTP_READ_TIMEOUT_SECONDS),
+    )
+
+def _close_async_engine():
+    loop = _async_engine['loop']
+    if loop is not None and _async_engine['session'] is not None:
+        try:
+            asyncio.run_coroutine_threadsafe(_async_engine['session'].close(), loop).result(timeout=5)
+        except Exception as e:
+            logger.warning(f"Could not close async HTTP session cleanly: {e}")
+
+def ensure_async_engine_started():
+    """Starts the engine's event loop thread once per process. Returns the loop."""
+    with _async_engine_lock:
+        if _async_engine['loop'] is not None:
+            return _async_engine['loop']
+        loop = asyncio.new_event_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=ASYNC_BLOCKING_THREADS, thread_name_prefix='async-blocking'))
+        _async_engine['sheets_executor'] = ThreadPoolExecutor(max_workers=ASYNC_SHEETS_THREADS, thread_name_prefix='async-sheets')
+        threading.Thread(target=loop.run_forever, name='async-engine', daemon=True).start()
+        asyncio.run_coroutine_threadsafe(_open_async_engine(), loop).result()
+        _async_engine['loop'] = loop
+        atexit.register(_close_async_engine)
+        logger.info(f"Started asyncio posting engine (max {ASYNC_MAX_IN_FLIGHT_POSTS} posts in flight, {ASYNC_HTTP_CONNECTION_LIMIT} connections).")
+        return loop
+
+async def _to_sheets_thread(func, *args):
+    """asyncio.to_thread() on the engine's Sheets executor."""
+    return await asyncio.get_running_loop().run_in_executor(_async_engine['sheets_executor'], partial(func, *args))
+
+def _wake_async_dispatcher():
+    loop = _async_engine['loop']
+    if loop is not None:
+        loop.call_soon_threadsafe(_async_engine['wakeup'].set)
+
+def submit_async_post(post_id, account_name, progress_callback=None):
+    """Schedules process_post_async() on the engine. Returns a concurrent.futures.Future of its result."""
+    loop = ensure_async_engine_started()
+    return asyncio.run_coroutine_threadsafe(_run_in_slot(process_post_async(post_id, account_name, progress_callback)), loop)
+
+async def _run_in_slot(coro):
+    async with _async_engine['slots']:
+        return await coro
+
+async def make_threads_api_request_async(endpoint, method='POST', params=None, data=None, headers=None, retries=3, delay=None):
+    """make_threads_api_request() on the shared aiohttp session, with the same rate bucket, retries and error classification."""
+    url = f"{THREADS_API_BASE_URL}{endpoint}"
+    if method.upper() not in ('POST', 'GET'):
+        logger.error(f"Unsupported HTTP method '{method}' for make_threads_api_request_async.")
+        return None
+    account = account_for_access_token((params or {}).get('access_token'))
+    bucket = get_rate_bucket(f"threads:{account}")
+    endpoint_label = _threads_endpoint_label(endpoint)
+    session = _async_engine['session']
+    attempt = 0
+    while attempt < retries:
+        retry_after = None
+        started = time.perf_counter()
+        try:
+            await bucket.acquire_async()
+            logger.info(f"API Call Attempt {attempt + 1}/{retries} to {method} {url}")
+            started = time.perf_counter()
+            async with session.request(method.upper(), url, params=params, json=data, headers=headers) as response:
+                response_text = await response.text()
+            record_outbound_call('threads', endpoint_label, time.perf_counter() - started, 'ok' if response.status < 400 else f'http_{response.status}', account=account)
+            logger.info(f"API Response Status: {response.status}")
+            try:
+                response_body = json.loads(response_text)
+            except ValueError:
+                response_body = None
+            if response.status < 400:
+                if response_body is None:
+                    raise ValueError(f"Response is not JSON: {response_text[:200]}")
+                return response_body
+            logger.error(f"API request failed (Attempt {attempt + 1}/{retries}): HTTP {response.status} - Response: {response_body or response_text[:500]}")
+            if not is_retryable_http_error(response.status, response_body):
+                logger.error(f"Non-retryable error from {url}. Giving up.")
+                return None
+            retry_after = parse_retry_after(response)
+            error = response_body.get('error') if isinstance(response_body, dict) else None
+            error_code = error.get('code') if isinstance(error, dict) else None
+            if response.status == 429 or retry_after is not None or error_code in THREADS_RATE_LIMIT_ERROR_CODES:
+                bucket.pause(retry_after if retry_after is not None else backoff_delay(attempt, base_delay=delay))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            record_outbound_call('threads', endpoint_label, time.perf_counter() - started, 'network_error', account=account)
+            logger.error(f"API request failed (Attempt {attempt + 1}/{retries}): {e!r}")
+        except Exception as e:
+            logger.exception(f"An unexpected error occurred during API request (Attempt {attempt + 1}/{retries}): {e}")
+        attempt += 1
+        if attempt < retries:
+            wait = backoff_delay(attempt - 1, retry_after, base_delay=delay)
+            logger.info(f"Retrying in {wait:.1f} seconds...")
+            await asyncio.sleep(wait)
+        else:
+            logger.error(f"Max retries reached for {url}. Giving up.")
+    return None
+
+async def create_threads_container_async(user_id, access_token, text_content, reply_to_id=None):
+    params = {'media_type': 'TEXT', 'text': text_content, 'access_token': access_token}
+    if reply_to_id:
+        params['reply_to_id'] = reply_to_id
+    logger.info(f"Creating container for user {user_id}, reply_to: {reply_to_id}")
+    response_data = await make_threads_api_request_async(f"{user_id}/threads", method='POST', params=params)
+    if response_data and 'id' in response_data:
+        logger.info(f"Created container with ID: {response_data['id']}")
+        return response_data['id']
+    logger.error(f"Failed to create container. Response: {response_data}")
+    return None
+
+async def publish_threads_container_async(user_id, access_token, creation_id):
+    logger.info(f"Publishing container {creation_id} for user {user_id}")
+    response_data = await make_threads_api_request_async(f"{user_id}/threads_publish", method='POST', params={'creation_id': creation_id, 'access_token': access_token})
+    if response_data and 'id' in response_data:
+        logger.info(f"Published container with Media ID: {response_data['id']}")
+        return response_data['id']
+    logger.error(f"Failed to publish container. Response: {response_data}")
+    return None
+
+async def get_threads_container_status_async(access_token, creation_id):
+    """Returns (status, error_message) for a media container, or (None, None) if the lookup failed."""
+    response_data = await make_threads_api_request_async(creation_id, method='GET', params={'fields': 'status,error_message', 'access_token': access_token}, retries=1)
+    if not response_data:
+        return None, None
+    return response_data.get('status'), response_data.get('error_message')
+
+async def wait_for_container_ready_async(access_token, creation_id):
+    """wait_for_container_ready() with awaited sleeps. Returns (ready, error_message)."""
+    if CONTAINER_READINESS_MODE != 'poll':
+        logger.info(f"Waiting {POST_DELAY_SECONDS} seconds before publishing container {creation_id}...")
+        await asyncio.sleep(POST_DELAY_SECONDS)
+        return True, None
+
+    deadline = time.monotonic() + POST_DELAY_SECONDS
+    interval = CONTAINER_POLL_INITIAL_SECONDS
+    while True:
+        status, error_message = await get_threads_container_status_async(access_token, creation_id)
+        if status in ('FINISHED', 'PUBLISHED'):
+            logger.info(f"Container {creation_id} is {status}.")
+            return True, None
+        if status in ('ERROR', 'EXPIRED'):
+            logger.error(f"Container {creation_id} is {status}: {error_message}")
+            return False, error_message or f"Container status {status}"
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logger.warning(f"Container {creation_id} not FINISHED after {POST_DELAY_SECONDS}s (last status: {status}). Publishing anyway.")
+            return True, None
+        await asyncio.sleep(min(interval, remaining))
+        interval = min(interval * 2, CONTAINER_POLL_MAX_SECONDS)
+
+async def post_thread_blocks_async(threads_user_id, threads_access_token, blocks_content, report_progress, post_id=None):
+    """post_thread_blocks() for the asyncio engine: same ledger resume rules and return value."""
+    ledger = await asyncio.to_thread(get_ledger_blocks, post_id) if post_id is not None else {}
+    account = account_for_access_token(threads_access_token)
+    root_threads_media_id = None
+    previous_block_media_id = None
+
+    async def report(block_number, state, **details):
+        if ROW_CLAIM_MODE == 'sheet': # The reporter may renew the row's lease in Sheets
+            await _to_sheets_thread(partial(report_progress, block_number, state, **details))
+        else:
+            await asyncio.to_thread(report_progress, block_number, state, **details)
+
+    async def record(block_number, **ids):
+        if post_id is not None:
+            await asyncio.to_thread(record_ledger_block, post_id, block_number, account, **ids)
+
+    for i, block_content_raw in enumerate(blocks_content):
+        block_content = block_content_raw.strip()
+        block_number = i + 1
+        if not block_content:
+            logger.info(f"Block {block_number} is empty. Skipping.")
+            await report(block_number, 'skipped')
+            continue
+
+        ledger_entry = ledger.get(block_number, {})
+        if ledger_entry.get('media_id'):
+            published_media_id = ledger_entry['media_id']
+            logger.info(f"Block {block_number} was already published as {published_media_id} (ledger). Resuming after it.")
+            await report(block_number, 'published', media_id=published_media_id, resumed=True)
+            if block_number == 1:
+                root_threads_media_id = published_media_id
+            previous_block_media_id = published_media_id
+            continue
+
+        creation_id = ledger_entry.get('container_id')
+        if creation_id:
+            container_status, _ = await get_threads_container_status_async(threads_access_token, creation_id)
+            if container_status == 'PUBLISHED':
+                error_note = f"Block {block_number} container {creation_id} is already published but its media ID was not recorded. Check the thread on Threads before retrying."
+                logger.error(error_note)
+                await report(block_number, 'failed', error_message=error_note)
+                return None, error_note
+            if container_status in ('FINISHED', 'IN_PROGRESS'):
+                logger.info(f"Reusing container {creation_id} for Block {block_number} from an earlier attempt.")
+            else:
+                creation_id = None
+
+        if not creation_id:
+            logger.info(f"Attempting to post Block {block_number}...")
+            with timed_stage('container_create', account=account) as stage:
+                creation_id = await create_threads_container_async(
+                    threads_user_id, threads_access_token, block_content,
+                    reply_to_id=previous_block_media_id
+                )
+                stage['outcome'] = 'ok' if creation_id else 'error'
+            if not creation_id:
+                error_note = f"Failed to create container for Block {block_number}"
+                logger.error(error_note)
+                await report(block_number, 'failed', error_message=error_note)
+                return None, error_note
+            await record(block_number, container_id=creation_id)
+        await report(block_number, 'container_created', container_id=creation_id)
+
+        with timed_stage('container_wait', account=account) as stage:
+            container_ready, container_error = await wait_for_container_ready_async(threads_access_token, creation_id)
+            stage['outcome'] = 'ok' if container_ready else 'error'
+        if not container_ready:
+            error_note = f"Container for Block {block_number} failed processing: {container_error}"
+            logger.error(error_note)
+            await report(block_number, 'failed', error_message=error_note)
+            await record(block_number, container_id='') # Don't try to reuse it
+            return None, error_note
+
+        with timed_stage('publish', account=account) as stage:
+            published_media_id = await publish_threads_container_async(threads_user_id, threads_access_token, creation_id)
+            stage['outcome'] = 'ok' if published_media_id else 'error'
+        if not published_media_id:
+            error_note = f"Failed to publish container for Block {block_number}"
+            logger.error(error_note)
+            await report(block_number, 'failed', error_message=error_note)
+            return None, error_note
+        await record(block_number, media_id=published_media_id)
+        await report(block_number, 'published', media_id=published_media_id)
+
+        if block_number == 1:
+            root_threads_media_id = published_media_id
+        previous_block_media_id = published_media_id
+
+    return root_threads_media_id, None
+
+async def process_post_async(post_id_to_post, account_name_to_use, progress_callback=None, lane_checked=False):
+    """process_post() as a coroutine on the engine loop; Sheets and ledger steps run in the executor."""
+    lock_token = await asyncio.to_thread(acquire_post_lock, post_id_to_post)
+    if lock_token is None:
+        error_note = f"Post_ID {post_id_to_post} is already being posted by another worker."
+        logger.warning(error_note)
+        return {'status': 'failure', 'account_name': account_name_to_use, 'error_message': error_note}
+    try:
+        with timed_stage('process_post', account=account_name_to_use) as stage:
+            prepared, result = await _to_sheets_thread(_prepare_post, post_id_to_post, account_name_to_use, lane_checked)
+            if prepared:
+                sheet, row_index, blocks_content, threads_user_id, threads_access_token = prepared
+                report_progress = _progress_reporter(progress_callback, post_id_to_post, sheet=sheet)
+                root_threads_media_id, error_note = await post_thread_blocks_async(threads_user_id, threads_access_token, blocks_content, report_progress, post_id=post_id_to_post)
+                result = await _to_sheets_thread(_finish_post, sheet, row_index, post_id_to_post, account_name_to_use, root_threads_media_id, error_note)
+            stage['outcome'] = result.get('status', 'failure')
+        inc_counter('threads_bot_posts_total', 'Posting attempts by account and outcome.', account=account_lane(account_name_to_use), outcome=stage['outcome'])
+        return result
+    finally:
+        await asyncio.to_thread(release_post_lock, post_id_to_post, lock_token)
+
+async def run_job_async(job):
+    logger.info(f"Async engine running job {job['id']} (attempt {job['attempts'] + 1})")
+    try:
+        progress_callback = _job_progress_callback(job['id'])
+        if job.get('kind') == 'batch':
+            result = await asyncio.to_thread(process_posts_batch, progress_callback=progress_callback, **json.loads(job['payload']))
+        else:
+            result = await process_post_async(job['post_id'], job['account_name'], progress_callback=progress_callback, lane_checked=True)
+    except Exception as e:
+        result = _job_failure_result(job, e)
+    await asyncio.to_thread(_record_job_result, job, result)
+
+async def _async_job_dispatcher():
+    """Claims jobs from the durable queue while in-flight slots are free and runs each as a task."""
+    slots = _async_engine['slots']
+    wakeup = _async_engine['wakeup']
+    while True:
+        await slots.acquire()
+        wakeup.clear()
+        try:
+            job = await asyncio.to_thread(claim_next_job)
+        except Exception as e:
+            logger.error(f"Could not claim job from {JOBS_DB_PATH}: {e}")
+            job = None
+        if job is None:
+            slots.release()
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        task = asyncio.create_task(run_job_async(job))
+        _async_engine['tasks'].add(task) # Keep a reference until it finishes
+        task.add_done_callback(_async_engine['tasks'].discard)
+        task.add_done_callback(lambda _: slots.release())
+
+
+# --- Scheduler ---
+# Posts Ready_To_Post rows at the time in their Scheduled_Time column, so n8n no
+# longer has to call /process_post for each row. Every SCHEDULER_SYNC_SECONDS
+# the sheet is read once (one get_all_values() through the snapshot) and the
+# difference against the previous sync is applied to a min-heap of due times;
+# rows that were edited, rescheduled or are no longer Ready just make their old
+# heap entry stale. The scheduler thread sleeps until the next due time or sync,
+# and hands due rows to the durable job queue, which applies account lanes and
+# posting limits.
+_scheduler_wakeup = threading.Condition()
+_scheduler_state = {'started': False, 'last_sync': None, 'last_sync_error': None}
+_schedule_heap = [] # (due_ts, post_id); entries not matching _scheduled are stale
+_scheduled = {} # post_id -> (due_ts, account_name)
+_schedule_dispatched = {} # post_id -> due_ts already handed to the job queue
+_schedule_skipped = {} # post_id -> Scheduled_Time value we already warned about
+_schedule_failures = {} # post_id -> {'due_ts', 'failures', 'retry_at'} for dispatches whose job ended without a Status
+
+def _parse_scheduled_time(value):
+    """Returns the epoch time for a Scheduled_Time cell (see SCHEDULED_TIME_FORMATS). Raises ValueError if unreadable."""
+    value = str(value).strip()
+    try:
+        return _parse_post_timestamp(value).timestamp()
+    except ValueError:
+        pass
+    for time_format in SCHEDULED_TIME_FORMATS:
+        try:
+            return datetime.strptime(value, time_format).timestamp() # Naive: server local time
+        except ValueError:
+            continue
+    try:
+        serial_days = float(value) # Sheets serial date: days since 1899-12-30, in the sheet's timezone
+    except ValueError:
+        raise ValueError(f"Unrecognized {SCHEDULED_TIME_COLUMN} value '{value}'") from None
+    try:
+        return (datetime(1899, 12, 30) + timedelta(days=serial_days)).timestamp()
+    except (OverflowError, ValueError):
+        raise ValueError(f"Unrecognized {SCHEDULED_TIME_COLUMN} value '{value}'") from None
+
+def _scheduled_rows(sheet):
+    """Returns {post_id: (due_ts, account_name)} for Ready rows with a usable Scheduled_Time."""
+    refresh_ready_to_post_snapshot(sheet, force=True)
+    due_rows = {}
+    skipped = {}
+    now = time.time()
+    for row_index, row_data in get_cached_ready_rows(sheet):
+        post_id = str(row_data.get('Post_ID', '')).strip()
+        scheduled_value = str(row_data.get(SCHEDULED_TIME_COLUMN, '')).strip()
+        if not post_id or not scheduled_value or not is_row_claimable(row_data) or post_id in due_rows:
+            continue
+        account_name = row_data.get('Account_Name') or row_data.get('Account') or SCHEDULER_DEFAULT_ACCOUNT
+        try:
+            due_ts = _parse_scheduled_time(scheduled_value)
+        except ValueError:
+            skipped[post_id] = scheduled_value
+            if _schedule_skipped.get(post_id) != scheduled_value:
+                logger.warning(f"Post_ID '{post_id}' (row {row_index}) has an unreadable {SCHEDULED_TIME_COLUMN} '{scheduled_value}' (use ISO 8601 or one of {SCHEDULED_TIME_FORMATS}). Not scheduling it.")
+            continue
+        if not account_name:
+            skipped[post_id] = scheduled_value
+            if _schedule_skipped.get(post_id) != scheduled_value:
+                logger.warning(f"Post_ID '{post_id}' (row {row_index}) has no Account_Name and SCHEDULER_DEFAULT_ACCOUNT is not set. Not scheduling it.")
+            continue
+        if SCHEDULER_MAX_LATENESS_SECONDS and now - due_ts > SCHEDULER_MAX_LATENESS_SECONDS:
+            skipped[post_id] = scheduled_value
+            if _schedule_skipped.get(post_id) != scheduled_value:
+                logger.warning(f"Post_ID '{post_id}' was due at {scheduled_value}, more than {SCHEDULER_MAX_LATENESS_SECONDS:.0f}s ago. Not posting it.")
+            continue
+        due_rows[post_id] = (due_ts, account_name)
+    _schedule_skipped.clear()
+    _schedule_skipped.update(skipped)
+    return due_rows
+
+def sync_schedule(sheet=None):
+    """Re-reads Ready_To_Post and applies added, moved and removed schedules to the heap. Returns the number of changes."""
+    sheet = sheet or get_google_sheet_client()
+    if not sheet:
+        raise RuntimeError('Failed to connect to Google Sheets.')
+    due_rows = _scheduled_rows(sheet)
+    with _scheduler_wakeup:
+        dispatched = {post_id: due_ts for post_id, due_ts in _schedule_dispatched.items() if not _schedule_failures.get(post_id, {}).get('gave_up')}
+    # A dispatched row that is still Ready with no queued or running job had its job
+    # end without writing a Status (e.g. missing credentials). It is queued again
+    # after SCHEDULER_SYNC_SECONDS, doubling each time, and given up (listed under
+    # 'skipped') once JOB_MAX_ATTEMPTS jobs have ended that way.
+    finished = {
+        post_id for post_id, due_ts in dispatched.items()
+        if due_rows.get(post_id, (None,))[0] == due_ts and not has_open_job(post_id)
+    }
+    changes = 0
+    now = time.time()
+    with _scheduler_wakeup:
+        for post_id in list(_scheduled):
+            if post_id not in due_rows:
+                del _scheduled[post_id] # Its heap entry is now stale
+                changes += 1
+        for post_id in list(_schedule_dispatched):
+            if post_id not in due_rows or due_rows[post_id][0] != _schedule_dispatched[post_id]:
+                del _schedule_dispatched[post_id] # Posted, edited or rescheduled since we dispatched it
+                _schedule_failures.pop(post_id, None)
+            elif post_id in finished and _schedule_dispatched[post_id] == dispatched[post_id]:
+                _retry_failed_dispatch(post_id, dispatched[post_id], now)
+        for post_id, (due_ts, account_name) in due_rows.items():
+            if _schedule_dispatched.get(post_id) == due_ts or _scheduled.get(post_id) == (due_ts, account_name):
+                continue
+            if _scheduled.get(post_id, (None,))[0] != due_ts:
+                heapq.heappush(_schedule_heap, (due_ts, post_id))
+            _scheduled[post_id] = (due_ts, account_name)
+            changes += 1
+        if len(_schedule_heap) > 2 * len(_scheduled) + 64: # Mostly stale entries: rebuild
+            _schedule_heap[:] = [(due_ts, post_id) for post_id, (due_ts, _) in _scheduled.items()]
+            heapq.heapify(_schedule_heap)
+        _scheduler_state['last_sync'] = time.time()
+        _scheduler_state['last_sync_error'] = None
+        _scheduler_wakeup.notify()
+    if changes:
+        logger.info(f"Schedule sync applied {changes} changes; {len(_scheduled)} posts scheduled.")
+    return changes
+
+def _retry_failed_dispatch(post_id, due_ts, now):
+    """Counts a dispatched job that ended without a Status and forgets the dispatch once its backoff has passed. Caller holds _scheduler_wakeup."""
+    record = _schedule_failures.get(post_id)
+    if record is None or record['due_ts'] != due_ts:
+        record = _schedule_failures[post_id] = {'due_ts': due_ts, 'failures': 0, 'retry_at': None, 'gave_up': False}
+    if record['retry_at'] is None: # First sync to see this dispatch's job end
+        record['failures'] += 1
+        if record['failures'] >= JOB_MAX_ATTEMPTS:
+            record['gave_up'] = True
+            logger.error(f"Scheduled Post_ID {post_id} is still Ready after {record['failures']} jobs. Not queuing it again until its row changes.")
+            return
+        record['retry_at'] = now + SCHEDULER_SYNC_SECONDS * 2 ** (record['failures'] - 1)
+        logger.warning(f"Scheduled Post_ID {post_id} is still Ready after its job finished ({record['failures']}/{JOB_MAX_ATTEMPTS}). Queuing it again in {record['retry_at'] - now:.0f}s.")
+    if now >= record['retry_at']:
+        record['retry_at'] = None
+        del _schedule_dispatched[post_id]
+
+def _pop_due_posts(now):
+    """Removes and returns [(post_id, account_name, due_ts)] due at `now`. Caller holds _scheduler_wakeup."""
+    due = []
+    while _schedule_heap and _schedule_heap[0][0] <= now:
+        due_ts, post_id = heapq.heappop(_schedule_heap)
+        entry = _scheduled.get(post_id)
+        if entry is None or entry[0] != due_ts:
+            continue # Stale: rescheduled or removed since it was pushed
+        del _scheduled[post_id]
+        _schedule_dispatched[post_id] = due_ts
+        due.append((post_id, entry[1], due_ts))
+    return due
+
+def _dispatch_due_posts(due):
+    for post_id, account_name, due_ts in due:
+        try:
+            if has_open_job(post_id):
+                logger.info(f"Scheduled Post_ID {post_id} already has a queued or running job. Not queuing it again.")
+                continue
+            job_id = enqueue_job(post_id, account_name)
+            lateness = time.time() - due_ts
+            inc_counter('threads_bot_scheduled_posts_total', 'Scheduled posts handed to the job queue.', account=account_lane(account_name))
+            logger.info(f"Scheduled Post_ID {post_id} is due (late by {lateness:.1f}s). Queued job {job_id}.")
+        except Exception as e:
+            logger.exception(f"Could not queue scheduled Post_ID {post_id}: {e}")
+            with _scheduler_wakeup:
+                _schedule_dispatched.pop(post_id, None) # Retried on the next sync
+
+def _scheduler_loop():
+    next_sync = 0.0
+    while True:
+        if time.monotonic() >= next_sync:
+            try:
+                sync_schedule()
+            except Exception as e:
+                handle_sheets_error(e)
+                _scheduler_state['last_sync_error'] = str(e)
+                logger.error(f"Schedule sync failed, keeping the previous schedule: {e}")
+            next_sync = time.monotonic() + SCHEDULER_SYNC_SECONDS
+        with _scheduler_wakeup:
+            due = _pop_due_posts(time.time())
+            if not due:
+                until_sync = max(next_sync - time.monotonic(), 0)
+                until_due = _schedule_heap[0][0] - time.time() if _schedule_heap else until_sync
+                _scheduler_wakeup.wait(timeout=max(min(until_sync, until_due), 0))
+                continue
+        _dispatch_due_posts(due)
+
+def get_schedule_status(limit=50):
+    """Returns the next `limit` scheduled posts plus sync state, for /schedule."""
+    with _scheduler_wakeup:
+        upcoming = sorted((due_ts, post_id, account_name) for post_id, (due_ts, account_name) in _scheduled.items())[:limit]
+        gave_up = {post_id: record for post_id, record in _schedule_failures.items() if record['gave_up']}
+        skipped = dict(_schedule_skipped)
+        for post_id, record in gave_up.items():
+            skipped[post_id] = f"{datetime.fromtimestamp(record['due_ts']).astimezone().isoformat()} (gave up after {record['failures']} jobs ended without a Status)"
+        return {
+            'enabled': SCHEDULER_ENABLED,
+            'time_formats': ['ISO 8601', *SCHEDULED_TIME_FORMATS, 'Sheets serial date number'],
+            'scheduled': len(_scheduled),
+            'dispatched_awaiting_status': len(_schedule_dispatched) - len(gave_up),
+            'skipped': skipped,
+            'last_sync': datetime.fromtimestamp(_scheduler_state['last_sync']).isoformat() if _scheduler_state['last_sync'] else None,
+            'last_sync_error': _scheduler_state['last_sync_error'],
+            'upcoming': [
+                {'post_id': post_id, 'account_name': account_name, 'due_at': datetime.fromtimestamp(due_ts).astimezone().isoformat()}
+                for due_ts, post_id, account_name in upcoming
+            ],
+        }
+
+def ensure_scheduler_started():
+    """Starts the scheduler thread once per process when SCHEDULER_ENABLED is set."""
+    if not SCHEDULER_ENABLED:
+        return
+    with _scheduler_wakeup:
+        if _scheduler_state['started']:
+            return
+        _scheduler_state['started'] = True
+    threading.Thread(target=_scheduler_loop, name='scheduler', daemon=True).start()
+    logger.info(f"Started scheduler on column '{SCHEDULED_TIME_COLUMN}' (sync every {SCHEDULER_SYNC_SECONDS:.0f}s).")
+
+
+# --- Flask Endpoint for Posting ---
+@app.route('/process_post', methods=['POST'])
+def process_post_endpoint():
+    logger.info("Received request at /process_post endpoint.")
+    request_data = request.get_json()
+    if not request_data or 'post_id' not in request_data or 'account_name' not in request_data:
+        logger.error("Invalid request data for /process_post. Missing post_id or account_name.")
+        return jsonify({'status': 'error', 'message': 'Invalid request data. Requires post_id and account_name.'}), 400
+    
+    post_id = request_data['post_id']
+    account_name = request_data['account_name']
+    
+    if request_data.get('wait'):
+        # Synchronous mode for callers that still expect the posting result in the response.
+        logger.info(f"Calling process_post function with Post_ID: {post_id}, Account: {account_name}")
+        if POSTING_ENGINE == 'asyncio':
+            result = submit_async_post(post_id, account_name).result()
+        else:
+            result = process_post(post_id, account_name)
+        log_payload("Returning result for /process_post for Post_ID %s: %s", post_id, result)
+        return jsonify(result), 200
+
+    job_id = enqueue_job(post_id, account_name)
+    return jsonify({'status': 'queued', 'job_id': job_id, 'status_url': f"/jobs/{job_id}"}), 202
+
+
+@app.route('/process_posts', methods=['POST'])
+def process_posts_endpoint():
+    logger.info("Received request at /process_posts endpoint.")
+    request_data = request.get_json(silent=True) or {}
+    account_name = request_data.get('account_name')
+    all_ready = bool(request_data.get('all_ready'))
+    items = request_data.get('items')
+    post_ids = request_data.get('post_ids')
+    if items is not None and (not isinstance(items, list) or any(not isinstance(item, dict) for item in items)):
+        return jsonify({'status': 'error', 'message': "Invalid request data. 'items' must be a list of {post_id, account_name} objects."}), 400
+    if post_ids is not None and (not isinstance(post_ids, list) or any(not isinstance(post_id, (str, int)) for post_id in post_ids)):
+        return jsonify({'status': 'error', 'message': "Invalid request data. 'post_ids' must be a list of Post_IDs."}), 400
+    if items is None and post_ids:
+        items = [{'post_id': post_id} for post_id in post_ids]
+    if not all_ready and not isinstance(items, list):
+        return jsonify({'status': 'error', 'message': "Invalid request data. Requires 'items', 'post_ids' or 'all_ready'."}), 400
+    if not all_ready and not account_name and any(not item.get('account_name') for item in items):
+        return jsonify({'status': 'error', 'message': 'Every item needs an account_name unless a default account_name is given.'}), 400
+
+    payload = {'items': items or [], 'account_name': account_name, 'all_ready': all_ready}
+    if request_data.get('wait'):
+        result = process_posts_batch(**payload)
+        return jsonify(result), 200
+
+    try:
+        jobs = enqueue_batch_jobs(**payload)
+    except Exception as e:
+        handle_sheets_error(e)
+        logger.error(f"Could not queue batch: {e}")
+        return jsonify({'status': 'error', 'message': f"Could not read {READY_TO_POST_WORKSHEET_NAME}: {e}"}), 503
+    return jsonify({
+        'status': 'queued',
+        'jobs': [{'account_name': job_account_name, 'job_id': job_id, 'status_url': f"/jobs/{job_id}"} for job_account_name, job_id in jobs],
+    }), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_endpoint(job_id):
+    ensure_job_workers_started()
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': f"Job '{job_id}' not found."}), 404
+    return jsonify(job), 200
+
+
+@app.route('/ledger/<post_id>', methods=['GET', 'DELETE'])
+def ledger_endpoint(post_id):
+    if request.method == 'DELETE':
+        removed = clear_ledger(post_id)
+        return jsonify({'status': 'cleared', 'post_id': post_id, 'blocks_removed': removed}), 200
+    blocks = get_ledger_blocks(post_id)
+    return jsonify({'post_id': post_id, 'blocks': {str(n): b for n, b in sorted(blocks.items())}}), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(render_prometheus_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/schedule', methods=['GET'])
+def get_schedule_endpoint():
+    if request.args.get('sync'):
+        try:
+            sync_schedule()
+        except Exception as e:
+            handle_sheets_error(e)
+            return jsonify({'error': f"Schedule sync failed: {e}"}), 500
+    return jsonify(get_schedule_status()), 200
+
+@app.route('/rate_limits', methods=['GET'])
+def get_rate_limits_endpoint():
+    return jsonify(get_rate_limit_status()), 200
+
+
+@app.route('/lanes', methods=['GET'])
+def get_lanes_endpoint():
+    return jsonify(get_account_lane_status()), 200
+
+
+# +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# | NEW Flask Endpoint for Getting Thread Insights                    |
+# +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+def extract_insight_metrics(threads_api_response_data):
+    """Flattens a Threads Insights API response into {metric_name: value}."""
+    extracted_metrics = {}
+    if 'data' in threads_api_response_data and isinstance(threads_api_response_data['data'], list):
+        for metric_entry in threads_api_response_data['data']:
+            metric_name = metric_entry.get('name')
+            if metric_entry.get('values') and isinstance(metric_entry['values'], list) and len(metric_entry['values']) > 0:
+                metric_value = metric_entry['values'][0].get('value')
+                if metric_name and metric_value is not None:
+                    extracted_metrics[metric_name] = metric_value
+    return extracted_metrics
+
+def fetch_thread_insights(threads_post_id, account_name):
+    """Fetches insights for one post. Returns (response_body, http_status) as served by /get_thread_insights."""
+    account_name_upper = account_name.upper()
+    insights_token_env_var_name = f"THREADS_ACCESS_TOKEN_{account_name_upper}"
+    access_token = os.getenv(insights_token_env_var_name) 
+
+    logger.info(f"Attempting to retrieve insights token for '{account_name}' using env var name: '{insights_token_env_var_name}'")
+
+    if not access_token:
+        logger.critical(f"Insights Token NOT FOUND for account '{account_name}' using env var '{insights_token_env_var_name}'. Ensure this environment variable is set on Railway and the token has 'threads_manage_insights' permission.")
+        return {"error": f"Server configuration error: Insights Token for account '{account_name}' not set up. Expected env var: {insights_token_env_var_name}"}, 500
+    else:
+        logger.info(f"Successfully retrieved insights token (token length: {len(access_token)}).")
+
+    insights_api_call_url = f"{THREADS_API_BASE_URL}{threads_post_id}/insights"
+    
+    api_params = {
+        "metric": INSIGHTS_METRICS,
+        "access_token": access_token 
+    }
+    
+    logger.info(f"Calling Threads Insights API: GET {insights_api_call_url} for account {account_name}")
+
+    response = None
+    bucket = get_rate_bucket(f"threads:{account_name_upper}")
+    try:
+        bucket.acquire()
+        started = time.perf_counter()
+        try:
+            response = get_http_session(insights_api_call_url).get(insights_api_call_url, params=api_params, timeout=get_http_timeout(INSIGHTS_READ_TIMEOUT_SECONDS))
+        except requests.exceptions.RequestException:
+            record_outbound_call('threads', 'insights', time.perf_counter() - started, 'network_error', account=account_name_upper)
+            raise
+        record_outbound_call('threads', 'insights', time.perf_counter() - started, 'ok' if response.status_code < 400 else f'http_{response.status_code}', account=account_name_upper)
+        
+        logger.info(f"Threads Insights API Response Status Code: {response.status_code}")
+        log_payload("Threads Insights API Response Content: %s", response.text)
         response.raise_for_status()
         
         threads_api_response_data = response.json()
-        print(f"LOG: Successfully received and parsed JSON from Threads Insights API: {threads_api_response_data}")
+        log_payload("Successfully received and parsed JSON from Threads Insights API: %s", threads_api_response_data)
         
-        extracted_metrics = {}
-        if 'data' in threads_api_response_data and isinstance(threads_api_response_data['data'], list):
-            for metric_entry in threads_api_response_data['data']:
-                metric_name = metric_entry.get('name')
-                if metric_entry.get('values') and isinstance(metric_entry['values'], list) and len(metric_entry['values']) > 0:
-                    metric_value = metric_entry['values'][0].get('value')
-                    if metric_name and metric_value is not None:
-                        extracted_metrics[metric_name] = metric_value
+        extracted_metrics = extract_insight_metrics(threads_api_response_data)
         
         if not extracted_metrics: 
-            print("LOG: No specific metrics extracted from Threads API response. This might be normal if the post has no engagement yet, or if 'views' is still in development and returns no data for this post.")
-            return jsonify({
+            logger.info("No specific metrics extracted from Threads API response. This might be normal if the post has no engagement yet, or if 'views' is still in development and returns no data for this post.")
+            return {
                 "message": "Successfully called Threads API, but no specific metric values were extracted (e.g., post has no engagement, or some metrics are in development).",
                 "raw_threads_api_response": threads_api_response_data 
-            }), 200 
+            }, 200 
             
-        print(f"LOG: Sending extracted insights back to N8N: {extracted_metrics}")
-        return jsonify(extracted_metrics), 200
+        log_payload("Sending extracted insights back to N8N: %s", extracted_metrics)
+        return extracted_metrics, 200
 
     except requests.exceptions.HTTPError as http_err:
         error_content = "No response content"
         if http_err.response is not None:
             error_content = http_err.response.text
+            retry_after = parse_retry_after(http_err.response)
+            if http_err.response.status_code == 429 or retry_after is not None:
+                bucket.pause(retry_after if retry_after is not None else backoff_delay(0))
         error_details = f"HTTP error occurred calling Threads Insights API: {http_err} - Response: {error_content}"
-        print(f"ERROR: {error_details}")
-        return jsonify({"error": "Failed to fetch from Threads Insights API (HTTP Error)", "details": str(http_err), "response_text": error_content}), getattr(http_err.response, 'status_code', 500)
+        logger.error(error_details)
+        return {"error": "Failed to fetch from Threads Insights API (HTTP Error)", "details": str(http_err), "response_text": error_content}, getattr(http_err.response, 'status_code', 500)
     except requests.exceptions.RequestException as req_err:
         error_details = f"Request error occurred calling Threads Insights API: {req_err}"
-        print(f"ERROR: {error_details}")
-        return jsonify({"error": "Failed to fetch from Threads Insights API (Request Error)", "details": str(req_err)}), 500
+        logger.error(error_details)
+        return {"error": "Failed to fetch from Threads Insights API (Request Error)", "details": str(req_err)}, 500
     except ValueError as json_err: 
         response_text_for_error = ""
-        if 'response' in locals() and response is not None:
+        if response is not None:
             response_text_for_error = response.text
         error_details = f"JSON decode error from Threads Insights API response: {json_err} - Response: {response_text_for_error}"
-        print(f"ERROR: {error_details}")
-        return jsonify({"error": "Failed to parse Threads Insights API response", "details": str(json_err), "response_text": response_text_for_error}), 500
+        logger.error(error_details)
+        return {"error": "Failed to parse Threads Insights API response", "details": str(json_err), "response_text": response_text_for_error}, 500
     except Exception as e:
         error_details = f"An unexpected error occurred in /get_thread_insights: {e}"
-        print(f"ERROR: {error_details}")
-        traceback.print_exc(file=sys.stderr)
-        return jsonify({"error": "An internal server error occurred in insights endpoint", "details": str(e)}), 500
+        logger.exception(error_details)
+        return {"error": "An internal server error occurred in insights endpoint", "details": str(e)}, 500
+
+# --- Insights Cache ---
+# LRU cache of successful fetch_thread_insights() results keyed by Threads post
+# ID. How long an entry stays fresh depends on the post's age: new posts change
+# quickly and are re-fetched often, week-old posts barely move. Post creation
+# times come from the caller, from posts we published ourselves, or from one
+# `?fields=timestamp` lookup that is then remembered. Each entry keeps the TTL
+# it was stored with, so a hit needs no timestamp at all; the lookup only runs
+# on a real miss, and a failed one is not retried for
+# INSIGHTS_TIMESTAMP_RETRY_SECONDS.
+_insights_cache_lock = threading.Lock()
+_insights_cache = OrderedDict() # threads_post_id -> (fetched_monotonic, ttl_seconds, body)
+_post_timestamps = OrderedDict() # threads_post_id -> aware datetime the post went live
+_failed_timestamp_lookups = OrderedDict() # threads_post_id -> monotonic time of the last failed lookup
+
+def _parse_insights_ttl_tiers(spec):
+    tiers = []
+    for part in spec.split(','):
+        max_age, ttl = part.split(':')
+        tiers.append((float(max_age), float(ttl)))
+    return tiers
+
+_insights_ttl_tiers = _parse_insights_ttl_tiers(INSIGHTS_CACHE_TTL_TIERS)
+
+def _parse_post_timestamp(value):
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.astimezone() # Naive values are our own datetime.now() stamps
+
+def remember_post_timestamp(threads_post_id, timestamp_posted):
+    """Records when a post went live so its insights can be cached by age."""
+    try:
+        parsed = _parse_post_timestamp(timestamp_posted)
+    except ValueError:
+        logger.warning(f"Ignoring unparseable post timestamp '{timestamp_posted}' for {threads_post_id}.")
+        return
+    with _insights_cache_lock:
+        _post_timestamps[str(threads_post_id)] = parsed
+        _post_timestamps.move_to_end(str(threads_post_id))
+        while len(_post_timestamps) > INSIGHTS_CACHE_MAX_ENTRIES:
+            _post_timestamps.popitem(last=False)
+
+def _lookup_post_timestamp(threads_post_id, account_name):
+    key = str(threads_post_id)
+    with _insights_cache_lock:
+        known = _post_timestamps.get(key)
+        failed_at = _failed_timestamp_lookups.get(key)
+    if known is not None:
+        return known
+    if failed_at is not None and time.monotonic() - failed_at < INSIGHTS_TIMESTAMP_RETRY_SECONDS:
+        return None
+    access_token = os.getenv(f"THREADS_ACCESS_TOKEN_{account_name.upper()}")
+    if not access_token:
+        return None
+    response_data = make_threads_api_request(key, method='GET', params={'fields': 'timestamp', 'access_token': access_token}, retries=1)
+    if response_data and response_data.get('timestamp'):
+        remember_post_timestamp(key, response_data['timestamp'])
+        with _insights_cache_lock:
+            _failed_timestamp_lookups.pop(key, None)
+            return _post_timestamps.get(key)
+    logger.info(f"No timestamp for {key}; caching its insights as a fresh post for {INSIGHTS_TIMESTAMP_RETRY_SECONDS:.0f}s.")
+    with _insights_cache_lock:
+        _failed_timestamp_lookups[key] = time.monotonic()
+        _failed_timestamp_lookups.move_to_end(key)
+        while len(_failed_timestamp_lookups) > INSIGHTS_CACHE_MAX_ENTRIES:
+            _failed_timestamp_lookups.popitem(last=False)
+    return None
+
+def insights_cache_ttl(post_timestamp):
+    """Returns how many seconds cached insights stay fresh for a post created at `post_timestamp`."""
+    if post_timestamp is None:
+        return _insights_ttl_tiers[0][1] # Unknown age: treat as a fresh post
+    age = (datetime.now(post_timestamp.tzinfo) - post_timestamp).total_seconds()
+    for max_age, ttl in _insights_ttl_tiers:
+        if age < max_age:
+            return ttl
+    return _insights_ttl_tiers[-1][1]
+
+def get_thread_insights_cached(threads_post_id, account_name, timestamp_posted=None, bypass_cache=False):
+    """Cached fetch_thread_insights(). Returns (body, http_status, cache_info)."""
+    key = str(threads_post_id)
+    if timestamp_posted:
+        remember_post_timestamp(key, timestamp_posted)
+
+    if not bypass_cache:
+        with _insights_cache_lock:
+            entry = _insights_cache.get(key)
+            if entry is not None:
+                fetched, ttl, cached_body = entry
+                age = time.monotonic() - fetched
+                if age < ttl:
+                    _insights_cache.move_to_end(key)
+                    logger.info(f"Insights cache hit for {key} (age {age:.0f}s, ttl {ttl:.0f}s).")
+                    return dict(cached_body), 200, {'cache_hit': True, 'cache_age_seconds': round(age, 1), 'cache_ttl_seconds': ttl}
+
+    ttl = insights_cache_ttl(_lookup_post_timestamp(key, account_name))
+    body, status_code = fetch_thread_insights(threads_post_id, account_name)
+    if status_code == 200:
+        with _insights_cache_lock:
+            _insights_cache[key] = (time.monotonic(), ttl, dict(body))
+            _insights_cache.move_to_end(key)
+            while len(_insights_cache) > INSIGHTS_CACHE_MAX_ENTRIES:
+                _insights_cache.popitem(last=False)
+    return body, status_code, {'cache_hit': False, 'cache_age_seconds': 0, 'cache_ttl_seconds': ttl}
+
+@app.route('/get_thread_insights', methods=['POST'])
+def get_thread_insights_route():
+    logger.info("Received request at /get_thread_insights")
+
+    try:
+        n8n_data = request.get_json()
+        if not n8n_data:
+            logger.info("No JSON data received from N8N for insights")
+            return jsonify({"error": "No JSON data received from N8N"}), 400
+        log_payload("Received data from N8N for insights: %s", n8n_data)
+    except Exception as e:
+        logger.error(f"Error getting JSON from insights request: {e}")
+        return jsonify({"error": "Invalid JSON format in insights request"}), 400
+
+    threads_post_id = n8n_data.get('threads_post_id')
+    account_name_from_n8n = n8n_data.get('account_name') 
+
+    if not threads_post_id or not account_name_from_n8n:
+        logger.info("Missing threads_post_id or account_name in insights request")
+        return jsonify({"error": "Missing 'threads_post_id' or 'account_name' in N8N data for insights"}), 400
+
+    body, status_code, cache_info = get_thread_insights_cached(
+        threads_post_id, account_name_from_n8n,
+        timestamp_posted=n8n_data.get('timestamp_posted'),
+        bypass_cache=bool(n8n_data.get('bypass_cache'))
+    )
+    if status_code == 200:
+        body.update(cache_info)
+    return jsonify(body), status_code
+
+
+# --- Batch Insights ---
+# Shared bounded pool so concurrent batch requests can't open more than
+# INSIGHTS_BATCH_MAX_WORKERS simultaneous calls to the Insights API.
+_insights_executor = ThreadPoolExecutor(max_workers=INSIGHTS_BATCH_MAX_WORKERS, thread_name_prefix='insights')
+
+def fetch_thread_insights_batch(items, bypass_cache=False):
+    """Fetches insights for [{'threads_post_id', 'account_name'}] concurrently. Results keep the input order."""
+    def fetch_one(item):
+        threads_post_id = item.get('threads_post_id') if isinstance(item, dict) else None
+        account_name = item.get('account_name') if isinstance(item, dict) else None
+        result = {'threads_post_id': threads_post_id, 'account_name': account_name}
+        if not threads_post_id or not account_name:
+            result.update({'status_code': 400, 'error': "Missing 'threads_post_id' or 'account_name'"})
+            return result
+        if isinstance(threads_post_id, bool) or not isinstance(threads_post_id, (str, int)) or not isinstance(account_name, str):
+            result.update({'status_code': 400, 'error': "'threads_post_id' and 'account_name' must be strings"})
+            return result
+        try:
+            body, status_code, cache_info = get_thread_insights_cached(
+                str(threads_post_id), account_name,
+                timestamp_posted=item.get('timestamp_posted'),
+                bypass_cache=bypass_cache or bool(item.get('bypass_cache'))
+            )
+        except Exception as e:
+            logger.exception(f"Unhandled error fetching insights for {threads_post_id}: {e}")
+            result.update({'status_code': 500, 'error': {"error": "An internal server error occurred in insights endpoint", "details": str(e)}})
+            return result
+        result['status_code'] = status_code
+        if status_code == 200:
+            result['insights'] = body
+            result.update(cache_info)
+        else:
+            result['error'] = body
+        return result
+
+    return list(_insights_executor.map(fetch_one, items))
+
+@app.route('/get_thread_insights_batch', methods=['POST'])
+def get_thread_insights_batch_route():
+    logger.info("Received request at /get_thread_insights_batch")
+    n8n_data = request.get_json(silent=True)
+    items = n8n_data.get('items') if isinstance(n8n_data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Expected JSON body {'items': [{'threads_post_id': ..., 'account_name': ...}, ...]}"}), 400
+    if len(items) > INSIGHTS_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Too many items: {len(items)} (max {INSIGHTS_BATCH_MAX_ITEMS})."}), 400
+
+    results = fetch_thread_insights_batch(items, bypass_cache=bool(n8n_data.get('bypass_cache')))
+    succeeded = sum(1 for r in results if r['status_code'] == 200)
+    logger.info(f"Batch insights finished: {succeeded}/{len(results)} succeeded.")
+    return jsonify({'results': results, 'succeeded': succeeded, 'failed': len(results) - succeeded}), 200
+
+# --- Insights Harvester ---
+# Background job that fills the Insights_Last_Checked / Views / Likes / Replies
+# columns of Posted_Logs. Each cycle reads the log with one get_all_values(),
+# picks rows whose metrics are stale for their age (the same TTL tiers as the
+# insights cache), fetches up to INSIGHTS_HARVEST_BATCH_SIZE of them through
+# the shared insights pool and rate buckets, and writes everything back with
+# one batch_update(). Rows never checked come first, in sheet order starting
+# at a cursor where the previous cycle stopped, so a long log is covered over
+# successive cycles; then already-checked rows, most overdue first.
+INSIGHTS_HARVEST_COLUMNS = {'Views': 'views', 'Likes': 'likes', 'Replies': 'replies', 'Reposts': 'reposts', 'Quotes': 'quotes', 'Shares': 'shares'}
+_harvest_lock = threading.Lock() # One cycle at a time
+_harvest_start_lock = threading.Lock()
+_harvest_state = {'started': False, 'cursor': 2, 'last_cycle': None}
+_harvest_failures = {} # threads_post_id -> time.time() of its last failed fetch, so failures back off like a check
+
+def _parse_sheet_timestamp(value):
+    try:
+        return _parse_post_timestamp(value) if str(value).strip() else None
+    except ValueError:
+        return None
+
+def _harvest_candidates(all_values, now):
+    """Returns (columns, never_checked, stale), each a list of (row_number, item) in harvest order."""
+    headers = all_values[0] if all_values else []
+    columns = {name: index + 1 for index, name in enumerate(headers) if name}
+    if 'Threads_Post_ID' not in columns or 'Insights_Last_Checked' not in columns:
+        logger.error(f"{POSTED_LOGS_WORKSHEET_NAME} needs 'Threads_Post_ID' and 'Insights_Last_Checked' columns for insights harvesting. Found: {headers}")
+        return columns, [], []
+
+    def cell(values, header):
+        col = columns.get(header)
+        return str(values[col - 1]).strip() if col and len(values) >= col else ''
+
+    never_checked = []
+    stale = []
+    for row_number, values in enumerate(all_values[1:], start=2):
+        threads_post_id = cell(values, 'Threads_Post_ID')
+        account_name = cell(values, 'Account')
+        if not threads_post_id or not account_name:
+            continue
+        timestamp_posted = cell(values, 'Timestamp_Posted')
+        posted_at = _parse_sheet_timestamp(timestamp_posted)
+        last_checked = _parse_sheet_timestamp(cell(values, 'Insights_Last_Checked'))
+        last_checked_ts = max(last_checked.timestamp() if last_checked else 0, _harvest_failures.get(threads_post_id, 0))
+        item = {'threads_post_id': threads_post_id, 'account_name': account_name}
+        if posted_at is not None:
+            item['timestamp_posted'] = posted_at.isoformat()
+        if not last_checked_ts:
+            never_checked.append((row_number, item))
+            continue
+        if posted_at is not None and now - posted_at.timestamp() > INSIGHTS_HARVEST_MAX_POST_AGE_DAYS * 86400:
+            continue # Old enough that its metrics are treated as final
+        overdue_ratio = (now - last_checked_ts) / insights_cache_ttl(posted_at)
+        if overdue_ratio >= 1:
+            stale.append((overdue_ratio, row_number, item))
+
+    cursor = _harvest_state['cursor']
+    never_checked.sort(key=lambda entry: (entry[0] < cursor, entry[0])) # From the cursor to the end, then wrap
+    stale.sort(key=lambda entry: -entry[0])
+    return columns, never_checked, [(row_number, item) for _, row_number, item in stale]
+
+def harvest_insights_cycle():
+    """Runs one harvest cycle over Posted_Logs. Returns a summary dict."""
+    with _harvest_lock, timed_stage('insights_harvest') as stage:
+        sheet = get_google_sheet_client()
+        if not sheet:
+            stage['outcome'] = 'error'
+            return {'status': 'failure', 'error_message': 'Failed to connect to Google Sheets.'}
+        try:
+            worksheet = get_worksheet(sheet, POSTED_LOGS_WORKSHEET_NAME)
+            all_values = sheets_call('read', worksheet.get_all_values)
+        except Exception as e:
+            handle_sheets_error(e)
+            logger.error(f"Could not read {POSTED_LOGS_WORKSHEET_NAME} for insights harvesting: {e}")
+            stage['outcome'] = 'error'
+            return {'status': 'failure', 'error_message': f"Error reading {POSTED_LOGS_WORKSHEET_NAME}: {e}"}
+
+        now = time.time()
+        for threads_post_id, failed_at in list(_harvest_failures.items()):
+            if now - failed_at > 86400:
+                del _harvest_failures[threads_post_id]
+        columns, never_checked, stale = _harvest_candidates(all_values, now)
+        due = never_checked + stale
+        chosen = due[:INSIGHTS_HARVEST_BATCH_SIZE]
+        results = fetch_thread_insights_batch([item for _, item in chosen]) if chosen else []
+
+        checked_at = datetime.now().isoformat()
+        data = []
+        failed = 0
+        for (row_number, item), result in zip(chosen, results):
+            if result['status_code'] != 200:
+                failed += 1
+                _harvest_failures[item['threads_post_id']] = now
+                continue
+            _harvest_failures.pop(item['threads_post_id'], None)
+            metrics = result.get('insights') or {}
+            for header, metric in INSIGHTS_HARVEST_COLUMNS.items():
+                if header in columns and metric in metrics:
+                    data.append({'range': gspread.utils.rowcol_to_a1(row_number, columns[header]), 'values': [[metrics[metric]]]})
+            data.append({'range': gspread.utils.rowcol_to_a1(row_number, columns['Insights_Last_Checked']), 'values': [[checked_at]]})
+
+        if data:
+            try:
+                sheets_call('write', worksheet.batch_update, data, value_input_option='USER_ENTERED')
+            except Exception as e:
+                handle_sheets_error(e)
+                logger.exception(f"Could not write harvested insights to {POSTED_LOGS_WORKSHEET_NAME}: {e}")
+                stage['outcome'] = 'error'
+                return {'status': 'failure', 'error_message': f"Error writing {POSTED_LOGS_WORKSHEET_NAME}: {e}"}
+
+        chosen_never_checked = chosen[:len(never_checked)]
+        if chosen_never_checked:
+            next_row = chosen_never_checked[-1][0] + 1
+            _harvest_state['cursor'] = next_row if next_row <= len(all_values) else 2
+        checked = len(chosen) - failed
+        inc_counter('threads_bot_insights_harvested_total', 'Posted_Logs rows refreshed by the insights harvester.', checked, outcome='ok')
+        inc_counter('threads_bot_insights_harvested_total', 'Posted_Logs rows refreshed by the insights harvester.', failed, outcome='error')
+        summary = {
+            'status': 'success',
+            'rows': max(len(all_values) - 1, 0),
+            'due': len(due),
+            'checked': checked,
+            'failed': failed,
+            'remaining': len(due) - len(chosen),
+            'cursor': _harvest_state['cursor'],
+            'finished_at': checked_at,
+        }
+        _harvest_state['last_cycle'] = summary
+        logger.info(f"Insights harvest: {checked} rows updated, {failed} failed, {summary['remaining']} still due ({summary['rows']} rows in {POSTED_LOGS_WORKSHEET_NAME}).")
+        return summary
+
+def _insights_harvester_loop():
+    while True:
+        try:
+            harvest_insights_cycle()
+        except Exception as e:
+            logger.exception(f"Unexpected error in insights harvest cycle: {e}")
+        time.sleep(INSIGHTS_HARVEST_INTERVAL_SECONDS)
+
+def ensure_insights_harvester_started():
+    """Starts the harvester thread once per process when INSIGHTS_HARVEST_ENABLED is set."""
+    if not INSIGHTS_HARVEST_ENABLED:
+        return
+    with _harvest_start_lock:
+        if _harvest_state['started']:
+            return
+        _harvest_state['started'] = True
+    threading.Thread(target=_insights_harvester_loop, name='insights-harvester', daemon=True).start()
+    logger.info(f"Started insights harvester (every {INSIGHTS_HARVEST_INTERVAL_SECONDS:.0f}s, up to {INSIGHTS_HARVEST_BATCH_SIZE} rows per cycle).")
+
+@app.route('/insights_harvest', methods=['GET', 'POST'])
+def insights_harvest_endpoint():
+    if request.method == 'POST':
+        summary = harvest_insights_cycle()
+        return jsonify(summary), 200 if summary['status'] == 'success' else 500
+    return jsonify({'enabled': INSIGHTS_HARVEST_ENABLED, 'cursor': _harvest_state['cursor'], 'last_cycle': _harvest_state['last_cycle']}), 200
+
+
+# --- Metrics Gauges ---
+def _collect_runtime_gauges():
+    gauges = [('threads_bot_sheets_pending_writes', 'Sheets writes buffered but not yet flushed.', {}, _pending_count())]
+    for name, status in get_rate_limit_status().items():
+        gauges.append(('threads_bot_rate_tokens_available', 'Tokens currently available in each rate bucket.', {'bucket': name}, status['available']))
+    conn = _jobs_connect()
+    try:
+        for row in conn.execute("SELECT status, COUNT(*) FROM jobs WHERE status IN ('queued', 'running') GROUP BY status"):
+            gauges.append(('threads_bot_jobs', 'Jobs currently queued or running.', {'status': row[0]}, row[1]))
+    finally:
+        conn.close()
+    return gauges
+
+register_gauge_collector(_collect_runtime_gauges)
 
 # --- Main Execution (Starts Flask Server) ---
 if __name__ == "__main__":
-    print("Starting Flask web server to listen for N8N requests...")
+    logger.info("Starting Flask web server to listen for N8N requests...")
     port = int(os.environ.get("PORT", 8080)) 
+    ensure_sheets_writer_started() # Replay Sheets writes a previous process didn't flush
+    ensure_job_workers_started() # Resume jobs left queued or running by a previous deploy
+    ensure_scheduler_started()
+    ensure_insights_harvester_started()
     app.run(debug=False, host='0.0.0.0', port=port)